@@ -1,9 +1,20 @@
 from flask import Flask, request, jsonify
 from sqlalchemy.exc import IntegrityError
+from recognition.service import start_service, get_service
+from recognition.scheduler import scheduler_stats
+from recognition.embedding import is_ready, start_warm_up
+from datetime import date
 from functions import register, arrived, departed, assiduity, everyone, someone, arrivals, departures, update
+from functions import log_info
+from functions import attendance, attendance_report
+from database import remove_sessions
+from presence import get_presence_index
 
 app = Flask(__name__)
 
+# Each request thread gets its own sessions, closed (and rolled back if left open) once the request ends
+app.teardown_appcontext(remove_sessions)
+
 @app.route("/update", methods=["POST"])
 def api_update():
     data = request.form
@@ -57,7 +68,7 @@ def api_arrived():
         return jsonify({"error": "Profile image is required"}), 400
 
     try:
-        arrived(profile.read())
+        arrived(profile.read(), notify=log_info)
         return jsonify({"success": True}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -69,7 +80,7 @@ def api_departed():
         return jsonify({"error": "Profile image is required"}), 400
 
     try:
-        departed(profile.read())
+        departed(profile.read(), notify=log_info)
         return jsonify({"success": True}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -124,5 +135,77 @@ def api_departures(operator_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def _period_args() -> tuple[date | None, date | None]:
+    """
+    The optional `start` and `end` (YYYY-MM-DD) query arguments of a report.
+    :raises ValueError: If a date is invalid or the period starts after it ends.
+    """
+    days = {}
+    for name in ('start', 'end'):
+        value = request.args.get(name)
+        try:
+            days[name] = date.fromisoformat(value) if value else None
+        except ValueError:
+            raise ValueError(f"Invalid {name} date '{value}', expected YYYY-MM-DD")
+    start, end = days['start'], days['end']
+    if start and start > (end or date.today()):
+        raise ValueError(f"The period starts ({start}) after it ends ({end or date.today()})")
+    return start, end
+
+@app.route('/attendance/<string:operator_id>', methods=['GET'])
+def api_attendance(operator_id):
+    try:
+        start, end = _period_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        result = attendance(operator_id, start, end)
+        return jsonify(result), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/attendance', methods=['GET'])
+def api_attendance_report():
+    try:
+        start, end = _period_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        result = attendance_report(start, end)
+        return jsonify(result), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/presence', methods=['GET'])
+def api_presence():
+    try:
+        result = get_presence_index().counts()
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/health/ready', methods=['GET'])
+def api_ready():
+    service = get_service()
+    if service:
+        ready = service.ready
+    else:
+        start_warm_up()  # No-op once started, the first probe starts loading the model
+        ready = is_ready()
+    return jsonify({"ready": ready}), 200 if ready else 503
+
+@app.route('/inference/stats', methods=['GET'])
+def api_inference_stats():
+    service = get_service()
+    return jsonify({
+        "scheduler": scheduler_stats(),
+        "service": service.stats() if service else None
+    }), 200
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    start_service()
+    app.run(debug=True, use_reloader=False)
@@ -0,0 +1,314 @@
+"""
+Write-behind queue for attendance events (arrivals and departures).
+Events are checked against today's presence index (see `presence.py`), appended to an optional
+journal, and committed to the database in batches by a background thread, so a check-in
+never waits for a commit.
+"""
+
+import os
+import json
+import atexit
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import DateTime, String, exists, insert, literal, select
+
+from models import Arrival, Departure
+from database import session
+from rollup import apply_events
+from presence import PresenceIndex, get_presence_index
+
+# A batch is committed when it holds this many events...
+ATTENDANCE_BATCH_SIZE = 50
+
+# ...or this long after its first event was queued
+ATTENDANCE_FLUSH_MS = 200
+
+# Directory of the append-only journals of the queued events, one per process,
+# replayed after a crash (None disables them)
+ATTENDANCE_JOURNAL_DIR = "./journal"
+
+# Sync the journal to disk on every event: survives a power loss, not only a process crash
+ATTENDANCE_JOURNAL_FSYNC = False
+
+EVENT_MODELS = {"arrival": Arrival, "departure": Departure}
+
+
+def _try_lock(journal) -> bool:
+    """
+    Lock a journal file for this process without waiting.
+    :return: False when another (live) process holds it.
+    """
+    try:
+        if os.name == "nt":
+            import msvcrt
+            journal.seek(0)
+            msvcrt.locking(journal.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(journal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _store(events: list) -> list:
+    """
+    Insert the events the database has no event of the same kind, operator and day for, in the current
+    transaction of `session`. The check is part of each insert statement, so an event stored meanwhile
+    by another process (the GUI and the API each have their own queue) is never duplicated.
+    :param events: (kind, operator_id, datestamp) tuples.
+    :return: The events inserted.
+    """
+    stored = []
+    for event in events:
+        kind, operator_id, datestamp = event
+        table = EVENT_MODELS[kind].__table__
+        day_start = datetime.combine(datestamp.date(), datetime.min.time())
+        already = exists().where(table.c.operator_id == operator_id, table.c.datestamp >= day_start,
+                                 table.c.datestamp < day_start + timedelta(days=1))
+        row = select(literal(operator_id, String), literal(datestamp, DateTime)).where(~already)
+        if session.execute(insert(table).from_select([table.c.operator_id, table.c.datestamp], row)).rowcount:
+            stored.append(event)
+    return stored
+
+
+class AttendanceQueue:
+    """
+    In-process queue of attendance events, deduplicated against the presence index of the day
+    and flushed in batched transactions.
+    Events are visible to database reads once flushed, at most ATTENDANCE_FLUSH_MS later.
+    """
+
+    def __init__(self, batch_size: int = ATTENDANCE_BATCH_SIZE, flush_ms: float = ATTENDANCE_FLUSH_MS,
+                 journal_dir: str | None = ATTENDANCE_JOURNAL_DIR, fsync: bool = ATTENDANCE_JOURNAL_FSYNC,
+                 presence: PresenceIndex | None = None):
+        """
+        :param batch_size: Maximum number of events per transaction.
+        :param flush_ms: Maximum time an event waits before its batch is committed.
+        :param journal_dir: Directory of the journals making queued events durable,
+                            None to keep the events in memory only.
+        :param fsync: Sync the journal to disk on every event.
+        :param presence: The index the duplicates are checked against, the one of the process by default.
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self.journal_dir = journal_dir
+        self.fsync = fsync
+        self.journal = None
+        self.pending = deque()  # Groups of events, a group is never split across transactions
+        self.queued = 0  # Events in `pending`
+        self.in_flight = 0
+        self.condition = threading.Condition()
+        self.presence = presence or get_presence_index()
+        self.running = False
+        self.thread = None
+        self.committed = 0
+        self.batches = 0
+
+    def start(self) -> None:
+        """Replay the journals left by crashed processes, build today's presence and start the flushing thread."""
+        if self.running:
+            return
+        if self.journal_dir:
+            os.makedirs(self.journal_dir, exist_ok=True)
+            self._replay_journals()
+            # Locked for the life of the process, so other processes know it is not orphaned
+            self.journal = open(os.path.join(self.journal_dir, f"attendance-{os.getpid()}.journal"), "a+",
+                                encoding="utf-8")
+            _try_lock(self.journal)
+        self.presence.sync(force=True)  # Including the replayed events
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="attendance-writer", daemon=True)
+        self.thread.start()
+
+    def record(self, kind: str, operator_id: str, datestamp: datetime | None = None) -> datetime | None:
+        """
+        Queue an arrival or a departure, unless the operator already has one today.
+        :param kind: "arrival" or "departure".
+        :param operator_id: The recognized operator.
+        :param datestamp: When it happened, defaults to now.
+        :return: The datestamp of the queued event, None if it was a duplicate.
+        """
+        return self.record_many(kind, [operator_id], datestamp)[0]
+
+    def record_many(self, kind: str, operator_ids: list[str], datestamp: datetime | None = None) -> list:
+        """
+        Queue the same event for a group of operators, e.g. everyone recognized in one frame.
+        The group is committed in one transaction, whatever the batch size.
+        :param kind: "arrival" or "departure".
+        :param operator_ids: The recognized operators.
+        :param datestamp: When it happened, defaults to now.
+        :return: For each operator, the datestamp of the queued event, None if it was a duplicate.
+        """
+        if kind not in EVENT_MODELS:
+            raise ValueError(f"Unknown attendance event: {kind}")
+        if not self.running:
+            self.start()
+        datestamp = datestamp or datetime.now()
+        # Marked before taking the condition: `mark` may re-read the day from the database, and the
+        # writer thread must not wait on that. Each mark is an atomic test-and-set, so no event is queued twice.
+        group = [(kind, operator_id, datestamp) for operator_id in operator_ids
+                 if self.presence.mark(kind, operator_id, datestamp.date())]
+        with self.condition:
+            for event in group:
+                self._journal(event)
+            if group:
+                self.pending.append(group)
+                self.queued += len(group)
+                self.condition.notify()
+        queued = {operator_id for _, operator_id, _ in group}
+        return [datestamp if operator_id in queued else None for operator_id in operator_ids]
+
+    def has(self, kind: str, operator_id: str) -> bool:
+        """Whether the operator already has an event of this kind today (queued or stored)."""
+        return self.presence.has(kind, operator_id)
+
+    def _journal(self, event) -> None:
+        if self.journal is None:
+            return
+        kind, operator_id, datestamp = event
+        self.journal.write(json.dumps({"kind": kind, "operator_id": operator_id,
+                                       "datestamp": datestamp.isoformat()}) + "\n")
+        self.journal.flush()
+        if self.fsync:
+            os.fsync(self.journal.fileno())
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending or not self.running)
+                if not self.pending and not self.running:
+                    break
+                # Give the batch time to fill, unless it is already full or we are stopping
+                if self.running and self.queued < self.batch_size:
+                    self.condition.wait_for(lambda: self.queued >= self.batch_size or not self.running,
+                                            timeout=self.flush_interval)
+                # Whole groups only: a group larger than the batch size makes a batch on its own
+                batch = []
+                while self.pending and (not batch or len(batch) + len(self.pending[0]) <= self.batch_size):
+                    batch.extend(self.pending.popleft())
+                self.queued -= len(batch)
+                self.in_flight = len(batch)
+            self._commit(batch)
+
+    def _commit(self, batch: list) -> None:
+        """
+        Store a batch, and its daily attendance rollup, in one transaction;
+        on failure the events go back to the front of the queue.
+        The in-memory duplicate check only knows this process: the database has the last word.
+        """
+        try:
+            stored = _store(batch)
+            apply_events(stored)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logging.error(f"Error storing {len(batch)} attendance events, retrying: {e}")
+            with self.condition:
+                self.pending.appendleft(batch)
+                self.queued += len(batch)
+                self.in_flight = 0
+                self.condition.notify_all()
+                # Wait before retrying, the database may be busy or unavailable
+                self.condition.wait(timeout=1.0)
+            return
+        if len(stored) < len(batch):
+            logging.info(f"{len(batch) - len(stored)} attendance event(s) already stored by another process.")
+
+        with self.condition:
+            self.committed += len(stored)
+            self.batches += 1
+            self.in_flight = 0
+            if not self.pending and self.journal is not None:
+                # Every journaled event is stored now
+                self.journal.truncate(0)
+                self.journal.seek(0)
+            self.condition.notify_all()
+
+    def _replay_journals(self) -> None:
+        """Replay the journals no live process holds: their owner crashed before committing everything."""
+        for name in sorted(os.listdir(self.journal_dir)):
+            if not (name.startswith("attendance-") and name.endswith(".journal")):
+                continue
+            path = os.path.join(self.journal_dir, name)
+            with open(path, "r", encoding="utf-8") as journal:
+                if not _try_lock(journal):
+                    continue  # Its process is running
+                lines = journal.readlines()
+            if not lines:
+                continue  # Nothing to replay, or just created by a process about to lock it
+            self._replay(lines)
+            os.remove(path)
+            logging.info(f"Replayed the attendance journal {path}.")
+
+    def _replay(self, lines: list[str]) -> None:
+        """Store the journaled events a crash left uncommitted; the ones already stored are skipped."""
+        events = []
+        for line in lines:
+            try:
+                entry = json.loads(line)
+                events.append((entry["kind"], entry["operator_id"], datetime.fromisoformat(entry["datestamp"])))
+            except (ValueError, KeyError):
+                continue  # A line cut short by the crash
+        try:
+            apply_events(_store(events))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        Wait for the queued events to be committed.
+        :return: Whether the queue was emptied in time.
+        """
+        with self.condition:
+            self.condition.notify_all()
+            return self.condition.wait_for(lambda: not self.pending and not self.in_flight, timeout)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Commit what is queued and stop the flushing thread."""
+        if not self.running:
+            return
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.thread.join(timeout=timeout)
+        if self.journal is not None:
+            path = self.journal.name
+            clean = not self.pending and not self.in_flight
+            self.journal.close()
+            self.journal = None
+            if clean:
+                os.remove(path)  # Nothing left to replay
+
+    def stats(self) -> dict:
+        """
+        :return: Events waiting, committed and the number of transactions used.
+        """
+        with self.condition:
+            return {
+                "pending": self.queued + self.in_flight,
+                "committed": self.committed,
+                "batches": self.batches,
+            }
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_attendance_queue() -> AttendanceQueue:
+    """
+    The attendance queue of this process, started on first use and flushed on exit.
+    """
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = AttendanceQueue()
+            _queue.start()
+            atexit.register(_queue.stop)
+        return _queue
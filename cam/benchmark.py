@@ -0,0 +1,70 @@
+"""
+End-to-end benchmark of the capture pipeline on recorded sources, so it needs no camera:
+
+    python -m cam.benchmark recordings/gate1.mp4 recordings/gate2/ --max-speed --stride 2
+
+Each source (video file or image directory) plays the role of one camera of a gate.
+Reports the frames captured and processed per second and the recognitions per second.
+"""
+
+import time
+import shutil
+import argparse
+import tempfile
+
+from cam.manager import CaptureManager
+from cam.source import open_source
+
+
+def recognize(crop):
+    """Recognize a face crop with the real model, without registering an attendance."""
+    from recognition.compare import compare_face
+
+    found, details = compare_face(crop)
+    return details["operator_id"] if found else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sources", nargs="+", help="Video files or image directories, one per camera.")
+    parser.add_argument("--max-speed", action="store_true", help="Play the sources as fast as possible.")
+    parser.add_argument("--fps", type=float, default=None, help="Play the sources at this fixed frame rate.")
+    parser.add_argument("--stride", type=int, default=1, help="Detect faces on every Nth frame only.")
+    parser.add_argument("--recognize", action="store_true",
+                        help="Run the recognition model on each track (otherwise tracks are only counted).")
+    parser.add_argument("--duration", type=float, default=None, help="Stop after this many seconds.")
+    args = parser.parse_args()
+
+    sources = {f"camera{i}": open_source(source, realtime=not args.max_speed, fps=args.fps)
+               for i, source in enumerate(args.sources)}
+    save_dir = tempfile.mkdtemp(prefix="frs-benchmark-")
+    manager = CaptureManager(sources, recognizer=recognize if args.recognize else (lambda crop: None),
+                             save_dir=save_dir, stride=args.stride)
+
+    start = time.perf_counter()
+    manager.start()
+    try:
+        while manager.running and not manager.idle:
+            if args.duration is not None and time.perf_counter() - start >= args.duration:
+                break
+            time.sleep(0.1)
+    finally:
+        manager.stop()
+        elapsed = time.perf_counter() - start
+        shutil.rmtree(save_dir, ignore_errors=True)
+
+    stats = manager.stats()["cameras"]
+    print(f"{'camera':<12}{'captured':>10}{'processed':>10}{'dropped':>10}{'fps':>10}{'recognized':>12}{'rec/s':>10}")
+    for name, camera in stats.items():
+        print(f"{name:<12}{camera['captured']:>10}{camera['processed']:>10}{camera['dropped']:>10}"
+              f"{camera['processed'] / elapsed:>10.1f}{camera['recognized']:>12}{camera['recognized'] / elapsed:>10.2f}")
+    processed = sum(camera["processed"] for camera in stats.values())
+    recognized = sum(camera["recognized"] for camera in stats.values())
+    print(f"{'total':<12}{sum(c['captured'] for c in stats.values()):>10}{processed:>10}"
+          f"{sum(c['dropped'] for c in stats.values()):>10}{processed / elapsed:>10.1f}{recognized:>12}"
+          f"{recognized / elapsed:>10.2f}")
+    print(f"({elapsed:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
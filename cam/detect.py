@@ -1,27 +1,57 @@
 import cv2
 import os
-import time
+import logging
 import threading
 from datetime import datetime
 import customtkinter as ctk
-from PIL import Image, ImageTk
+
+from cam.pipeline import Pipeline, Frame, EndOfStream
+from cam.tracker import FaceTracker
+from cam.detector import FaceDetector, DETECTION_WIDTH, crop_face
+from cam.quality import score_faces, MIN_QUALITY
+from cam.writer import ImageWriter
+from cam.preview import PreviewRenderer, PREVIEW_WIDTH, PREVIEW_HEIGHT, PREVIEW_MAX_FPS
+from cam.source import open_source
+from recognition.crop import FaceCrop
 
 
 class FaceCapture:
-    def __init__(self, root, save_dir="captured_images", camera_index=0):
+    def __init__(self, root, save_dir="captured_images", camera_index=0, recognizer=None,
+                 detection_width=DETECTION_WIDTH, roi=None, stride=1, min_quality=MIN_QUALITY,
+                 preview_fps=PREVIEW_MAX_FPS, group_recognizer=None):
         """
         Initialize the FaceCapture class.
 
         :param root: The parent Tkinter window for embedding the camera feed.
         :param save_dir: Directory to save captured images.
-        :param camera_index: Index of the camera to use (default is 0 for the default camera).
+        :param camera_index: Index of the camera to use (default is 0 for the default camera), or any source
+                             accepted by `cam.source.open_source` (video file, image directory, FrameSource).
+        :param recognizer: Optional callable receiving the best `FaceCrop` of each track and returning its identity,
+                           kept for the preview. It runs on its own pipeline stage, so the preview never waits
+                           for it, and must not touch Tk: its notifications go through the Tk main loop, e.g.
+                           `partial(functions.arrived, notify=functions.tk_notifier(root))`.
+        :param detection_width: Width the frames are downscaled to for face detection.
+        :param roi: Optional (x, y, w, h) region of the frame to search for faces.
+        :param stride: Run the face detection on every Nth frame only.
+        :param min_quality: Quality score (see `cam.quality`) a face needs to be recognized or saved.
+        :param preview_fps: Maximum frame rate of the preview, independent of the capture rate.
+        :param group_recognizer: Optional callable receiving the crops of all the tracks ready at the same time
+                                 and returning one identity per crop, under the same rules as `recognizer`.
+                                 Used instead of `recognizer`, so people arriving side by side are recognized
+                                 in one batch.
         """
-        self.capture_thread = None
+        self.pipeline = None
+        self.tracker = None
+        self.frame_count = 0
+        self.recognizer = recognizer
+        self.group_recognizer = group_recognizer
         self.root = root
         self.save_dir = save_dir
         self.camera_index = camera_index
-        self.camera = cv2.VideoCapture(self.camera_index)
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+        self.camera = open_source(self.camera_index)
+        self.detector = FaceDetector(detection_width=detection_width, roi=roi, stride=stride)
+        self.writer = None  # Opened by `start`, closed by `stop`
+        self.min_quality = min_quality
 
         if not os.path.exists(self.save_dir):
             os.makedirs(self.save_dir)
@@ -30,8 +60,10 @@ class FaceCapture:
         self.lock = threading.Lock()
 
         # UI Components
-        self.frame_label = ctk.CTkLabel(root, text="Waiting for activation...", width=800, height=600)
+        self.frame_label = ctk.CTkLabel(root, text="Waiting for activation...", width=PREVIEW_WIDTH,
+                                        height=PREVIEW_HEIGHT)
         self.frame_label.pack(pady=10)
+        self.preview = PreviewRenderer(root, self.frame_label, max_fps=preview_fps)
 
         self.toggle_button = ctk.CTkButton(root, text="Start Capture", command=self.toggle_capture)
         self.toggle_button.pack(pady=10)
@@ -43,63 +75,127 @@ class FaceCapture:
         else:
             self.start()
 
-    def _generate_filename(self):
-        """Generate a unique filename for the captured image."""
+    def _generate_filename(self, track_id):
+        """Generate a unique filename for the captured image of a track."""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        return os.path.join(self.save_dir, f"image_{timestamp}.jpg")
+        return os.path.join(self.save_dir, f"image_{timestamp}_{track_id}.jpg")
 
     def start(self):
         """Start capturing frames."""
-        if not self.camera.isOpened():
+        if not self.camera.open():
             print("Error: Could not open camera.")
             return
 
+        self.writer = ImageWriter()
         self.running = True
         self.toggle_button.configure(text="Stop Capture")
         self.frame_label.configure(image="", text="")
 
-        self.capture_thread = threading.Thread(target=self._capture_frames, daemon=True)
-        self.capture_thread.start()
-
-    def _capture_frames(self):
-        """Continuously capture frames and update the UI."""
-        while self.running:
-            ret, frame = self.camera.read()
-            if not ret:
-                print("Error: Failed to capture frame.")
-                break
-
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = self.face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
-
-            for (x, y, w, h) in faces:
-                cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-
-            if len(faces) > 0:
-                filename = self._generate_filename()
-                cv2.imwrite(filename, frame)
-                print(f"Face detected! Image saved: {filename}")
-
-            # Convert frame for displaying in Tkinter
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(frame)
-            imgtk = ImageTk.PhotoImage(image=img)
+        # grab -> detect -> track -> (recognize) + render + persist, each stage on its own thread
+        self.tracker = FaceTracker(min_score=self.min_quality)
+        self.pipeline = Pipeline()
+        grab = self.pipeline.add_stage("grab", self._grab)
+        detect = self.pipeline.add_stage("detect", self._detect, grab)
+        track = self.pipeline.add_stage("track", self._track, detect)
+        if self.recognizer is not None or self.group_recognizer is not None:
+            self.pipeline.add_stage("recognize", self._recognize, track)
+        self.pipeline.add_stage("render", self._render, track)
+        self.pipeline.add_stage("persist", self._persist, track)
+        self.pipeline.on_stop = self._on_pipeline_stop
+        self.pipeline.start()
+
+    def _grab(self):
+        """Grab stage: read the next frame from the camera."""
+        ret, image = self.camera.read()
+        if not ret:
+            print("Error: Failed to capture frame.")
+            raise EndOfStream()
+        self.frame_count += 1
+        return Frame(self.frame_count, image)
+
+    def _detect(self, frame):
+        """
+        Detect stage: find the faces of the frame on a downscaled copy, score their quality and crop
+        the good enough ones at full resolution. Frames skipped by the detection stride get `faces` set to None.
+        """
+        if self.detector.should_detect(frame.index):
+            frame.faces = self.detector.detect(frame.image)
+            frame.scores = score_faces(frame.image, frame.faces)
+            frame.crops = [FaceCrop(crop_face(frame.image, box), box) if score >= self.min_quality else None
+                           for box, score in zip(frame.faces, frame.scores)]
+        else:
+            frame.faces = None
+        return frame
 
-            # Use root.after() to update UI safely
-            self.root.after(0, self.update_ui, imgtk)
+    def _track(self, frame):
+        """Track stage: follow the faces across frames, frames without detection keep the tracks as they are."""
+        if frame.faces is None:
+            frame.tracks = self.tracker.active()
+        else:
+            frame.tracks = self.tracker.update(frame.faces, frame.crops, frame.scores)
+        return frame
 
-            time.sleep(0.1)
+    def _recognize(self, frame):
+        """
+        Recognize stage: recognize each track once, on its best quality crop so far, and keep the identity.
+        The crop is embedded as is, recognition does not detect the face again.
+        This runs on a pipeline thread: the recognizers only return identities, they never touch Tk.
+        Tracks are taken from the tracker, so frames dropped by this stage lose nothing.
+        With a group recognizer, the tracks ready together are recognized in one call.
+        """
+        tracks = self.tracker.tracks_to_recognize()
+        if self.group_recognizer is not None:
+            if tracks:
+                identities = self.group_recognizer([track.best_image for track in tracks])
+                for track, identity in zip(tracks, identities):
+                    track.identity = identity
+            return
+        for track in tracks:
+            track.identity = self.recognizer(track.best_image)
+
+    def _render(self, frame):
+        """Render stage: draw the tracked faces on a downscaled preview, at the preview rate."""
+        annotations = [(track.box, track.identity if track.identity is not None else f"#{track.id}")
+                       for track in frame.tracks]
+        self.preview.render(frame.image, annotations)
+
+    def _persist(self, frame):
+        """Persist stage: save the best crop of each finished track."""
+        self._save_tracks(self.tracker.pop_finished())
+
+    def _save_tracks(self, tracks):
+        """Save the best crop of the given tracks, once per person rather than once per frame."""
+        for track in tracks:
+            if not self.tracker.is_usable(track):
+                continue  # Too short to be a real face, or never seen well enough
+            filename = self._generate_filename(track.id)
+            if self.writer.submit(filename, track.best_image.image):
+                print(f"Face detected! Image saved: {self.writer.path_for(filename)}")
+
+    def _on_pipeline_stop(self):
+        """Save the tracks still open and log how each stage kept up when the pipeline stops."""
+        self._save_tracks(self.tracker.close())
+        for name, stats in self.pipeline.stats().items():
+            logging.info(f"Stage {name}: {stats['processed']} processed, {stats['dropped']} dropped, "
+                         f"{stats['errors']} errors")
+        if self.running:
+            # The stream ended on its own, reflect it in the UI
+            self.root.after(0, self.stop)
 
-    def update_ui(self, imgtk):
-        """Safely update the UI with the new frame."""
-        if self.frame_label.winfo_exists():  # Ensure widget still exists
-            self.frame_label.configure(image=imgtk)
-            self.frame_label.image = imgtk
+    def stats(self):
+        """Per stage FPS and drop counts of the running pipeline, and the preview and writer counts."""
+        stats = self.pipeline.stats() if self.pipeline else {}
+        return {**stats, "preview": self.preview.stats(), "writer": self.writer.stats() if self.writer else None}
 
     def stop(self):
         """Stop capturing frames."""
         if self.running:
             self.running = False
+            if self.pipeline:
+                self.pipeline.stop()
+            # The last tracks are saved when the pipeline stops, make sure they reach the disk
+            self.writer.close(timeout=5)
+            self.preview.reset()
             self.toggle_button.configure(text="Start Capture")
             self.frame_label.configure(image="", text="Inactive")
 
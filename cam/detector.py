@@ -0,0 +1,79 @@
+import cv2
+import numpy as np
+
+# Width the frame is downscaled to before running the cascade
+DETECTION_WIDTH = 640
+# Smallest face to detect, in full resolution pixels
+MIN_FACE_SIZE = 60
+# Margin added around the face box when cropping, as a fraction of the box size.
+# Crops are embedded as is, tight like the box DeepFace's own detector would give.
+CROP_MARGIN = 0.0
+
+
+class FaceDetector:
+    """
+    Haar cascade face detector running on a downscaled copy of the frame (optionally restricted
+    to a region of interest and to every Nth frame), returning boxes in full resolution coordinates.
+    """
+
+    def __init__(self, detection_width: int = DETECTION_WIDTH, roi: tuple | None = None, stride: int = 1,
+                 min_face_size: int = MIN_FACE_SIZE):
+        """
+        :param detection_width: Width the frame (or region of interest) is downscaled to for detection.
+        :param roi: Optional (x, y, w, h) region of the frame to search, e.g. the area in front of the kiosk.
+        :param stride: Run the detection on every Nth frame only.
+        :param min_face_size: Smallest face to detect, in full resolution pixels.
+        """
+        if stride < 1:
+            raise ValueError("The detection stride must be at least 1.")
+        self.detection_width = detection_width
+        self.roi = roi
+        self.stride = stride
+        self.min_face_size = min_face_size
+        self.cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+
+    def should_detect(self, index: int) -> bool:
+        """
+        Whether the frame with this index is one of the frames the detector runs on.
+        """
+        return index % self.stride == 0
+
+    def detect(self, image: np.ndarray) -> np.ndarray:
+        """
+        Find the faces of a BGR frame.
+        :return: An (n, 4) array of (x, y, w, h) boxes in full resolution coordinates.
+        """
+        offset_x, offset_y = 0, 0
+        if self.roi is not None:
+            offset_x, offset_y, width, height = self.roi
+            image = image[offset_y:offset_y + height, offset_x:offset_x + width]
+
+        scale = min(1.0, self.detection_width / image.shape[1])
+        if scale < 1.0:
+            image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        min_size = max(int(self.min_face_size * scale), 20)
+        faces = self.cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(min_size, min_size))
+        if len(faces) == 0:
+            return np.empty((0, 4), dtype=np.int32)
+
+        boxes = np.asarray(faces, dtype=np.float32) / scale
+        boxes[:, 0] += offset_x
+        boxes[:, 1] += offset_y
+        return np.rint(boxes).astype(np.int32)
+
+
+def crop_face(image: np.ndarray, box, margin: float = CROP_MARGIN) -> np.ndarray:
+    """
+    Crop a face from a full resolution frame.
+    :param image: The BGR frame.
+    :param box: The (x, y, w, h) face box.
+    :param margin: Margin added on each side, as a fraction of the box size.
+    :return: A copy of the crop, so the frame can be released.
+    """
+    x, y, w, h = (int(value) for value in box)
+    dx, dy = int(w * margin), int(h * margin)
+    top, bottom = max(y - dy, 0), min(y + h + dy, image.shape[0])
+    left, right = max(x - dx, 0), min(x + w + dx, image.shape[1])
+    return image[top:bottom, left:right].copy()
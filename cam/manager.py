@@ -0,0 +1,287 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+
+from cam.pipeline import Frame, FrameQueue, RateMeter
+from cam.tracker import FaceTracker
+from cam.detector import FaceDetector, DETECTION_WIDTH, crop_face
+from cam.quality import score_faces, MIN_QUALITY
+from cam.writer import ImageWriter
+from cam.source import FrameSource, open_source
+from recognition.crop import FaceCrop
+
+
+class CameraFeed:
+    """
+    One camera of a gate: a thread grabbing its frames into a latest-frame-wins slot,
+    its own face tracker and its stats.
+    """
+
+    def __init__(self, name: str, source: FrameSource, min_quality: float):
+        """
+        :param name: Name of the camera in the stats and the saved images.
+        :param source: Where the frames come from.
+        :param min_quality: Quality score a face needs to be recognized or saved.
+        """
+        self.name = name
+        self.source = source
+        self.frames = FrameQueue(capacity=1)
+        self.tracker = FaceTracker(min_score=min_quality)
+        self.to_recognize = deque()
+        self.capture_meter = RateMeter()
+        self.process_meter = RateMeter()
+        self.frame_count = 0
+        self.processed = 0
+        self.recognized = 0
+        self.saved = 0
+        self.running = False
+        self.thread = None
+        self.on_frame_ready = None
+
+    def start(self) -> bool:
+        """
+        Open the camera and start grabbing frames.
+        :return: Whether the camera could be opened.
+        """
+        if not self.source.open():
+            logging.error(f"Could not open camera {self.name}.")
+            return False
+        self.running = True
+        self.thread = threading.Thread(target=self._grab, name=f"camera-{self.name}", daemon=True)
+        self.thread.start()
+        return True
+
+    def _grab(self) -> None:
+        while self.running:
+            ret, image = self.source.read()
+            if not ret:
+                logging.info(f"Camera {self.name} stopped delivering frames.")
+                break
+            self.frame_count += 1
+            self.frames.put(Frame(self.frame_count, image))
+            self.capture_meter.record()
+            if self.on_frame_ready:
+                self.on_frame_ready()
+        self.running = False
+
+    def stop(self) -> None:
+        self.running = False
+        self.frames.close()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2)
+        self.source.release()
+
+    def stats(self) -> dict:
+        """
+        :return: Capture and processing rates, dropped frames, open tracks and recognitions of the camera.
+        """
+        return {
+            "running": self.running,
+            "capture_fps": self.capture_meter.rate,
+            "processed_fps": self.process_meter.rate,
+            "captured": self.frame_count,
+            "processed": self.processed,
+            "dropped": self.frames.dropped,
+            "tracks": len(self.tracker.active()),
+            "waiting_recognition": len(self.to_recognize),
+            "recognized": self.recognized,
+            "saved": self.saved,
+        }
+
+
+class CaptureManager:
+    """
+    Runs the cameras of a gate in one process: each camera grabs frames on its own thread,
+    and one shared detection thread and one shared recognition thread serve them in turn,
+    so a busy camera never starves the others.
+    """
+
+    def __init__(self, cameras: dict, recognizer=None, save_dir: str = "captured_images",
+                 detection_width: int = DETECTION_WIDTH, stride: int = 1, min_quality: float = MIN_QUALITY,
+                 on_frame=None):
+        """
+        :param cameras: Camera names mapped to their source: camera index or URL, video file, image directory
+                        or FrameSource (see `cam.source.open_source`).
+        :param recognizer: Optional callable receiving the best `FaceCrop` of each track and returning its identity,
+                           kept for the stats. It runs on the shared recognition thread, so it must not touch Tk:
+                           e.g. `partial(functions.arrived, notify=functions.log_info)`, or `functions.tk_notifier`
+                           when a Tk app hosts the gate. (`functions.show_info` refuses to run off the Tk thread.)
+        :param save_dir: Directory the best crop of each track is saved in, one sub-directory per camera.
+        :param detection_width: Width the frames are downscaled to for face detection.
+        :param stride: Run the face detection on every Nth frame of each camera only.
+        :param min_quality: Quality score (see `cam.quality`) a face needs to be recognized or saved.
+        :param on_frame: Optional callable receiving (camera name, frame) after detection, e.g. for a preview.
+        """
+        self.feeds = [CameraFeed(name, open_source(source), min_quality) for name, source in cameras.items()]
+        self.recognizer = recognizer
+        self.save_dir = save_dir
+        self.detector = FaceDetector(detection_width=detection_width, stride=stride)
+        self.min_quality = min_quality
+        self.on_frame = on_frame
+        self.writer = ImageWriter()
+        self.frame_ready = threading.Event()
+        self.track_ready = threading.Event()
+        self.running = False
+        self.threads = []
+
+        for feed in self.feeds:
+            feed.on_frame_ready = self.frame_ready.set
+            os.makedirs(os.path.join(self.save_dir, feed.name), exist_ok=True)
+
+    def start(self) -> None:
+        """Open every camera and start the shared detection and recognition threads."""
+        if self.running:
+            return
+        started = [feed.start() for feed in self.feeds]
+        if not any(started):
+            print("Error: Could not open any camera.")
+            return
+        self.running = True
+        self.threads = [threading.Thread(target=self._detect_loop, name="gate-detect", daemon=True)]
+        if self.recognizer is not None:
+            self.threads.append(threading.Thread(target=self._recognize_loop, name="gate-recognize", daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def _detect_loop(self) -> None:
+        """
+        Shared detection: take the latest frame of each camera in turn, one frame per camera per round.
+        """
+        while self.running:
+            # Cleared before the round, so a frame arriving during it is not missed
+            self.frame_ready.clear()
+            found = False
+            for feed in self.feeds:
+                frame = feed.frames.get(timeout=0)
+                if frame is None:
+                    continue
+                found = True
+                try:
+                    self._process(feed, frame)
+                except Exception as e:
+                    logging.error(f"Error processing a frame of camera {feed.name}: {e}")
+            if not found:
+                self.frame_ready.wait(timeout=0.1)
+
+    def _process(self, feed: CameraFeed, frame: Frame) -> None:
+        """Detect, score, crop and track the faces of one frame of a camera."""
+        if self.detector.should_detect(frame.index):
+            frame.faces = self.detector.detect(frame.image)
+            frame.scores = score_faces(frame.image, frame.faces)
+            frame.crops = [FaceCrop(crop_face(frame.image, box), box) if score >= self.min_quality else None
+                           for box, score in zip(frame.faces, frame.scores)]
+            frame.tracks = feed.tracker.update(frame.faces, frame.crops, frame.scores)
+            if self.recognizer is not None:
+                ready = feed.tracker.tracks_to_recognize()
+                if ready:
+                    feed.to_recognize.extend(ready)
+                    self.track_ready.set()
+            self._save_tracks(feed, feed.tracker.pop_finished())
+        else:
+            frame.tracks = feed.tracker.active()
+
+        feed.processed += 1
+        feed.process_meter.record()
+        if self.on_frame:
+            self.on_frame(feed.name, frame)
+
+    def _recognize_loop(self) -> None:
+        """
+        Shared recognition: one track of each camera in turn, so a crowd in front of one camera
+        does not delay the others. Not the Tk thread: the recognizer only returns identities.
+        """
+        while self.running:
+            self.track_ready.clear()
+            found = False
+            for feed in self.feeds:
+                try:
+                    track = feed.to_recognize.popleft()
+                except IndexError:
+                    continue
+                found = True
+                try:
+                    track.identity = self.recognizer(track.best_image)
+                    feed.recognized += 1
+                except Exception as e:
+                    logging.error(f"Error recognizing track {track.id} of camera {feed.name}: {e}")
+            if not found:
+                self.track_ready.wait(timeout=0.1)
+
+    def _save_tracks(self, feed: CameraFeed, tracks) -> None:
+        """Save the best crop of the finished tracks of a camera."""
+        for track in tracks:
+            if not feed.tracker.is_usable(track):
+                continue
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = os.path.join(self.save_dir, feed.name, f"image_{timestamp}_{track.id}.jpg")
+            if self.writer.submit(filename, track.best_image.image):
+                feed.saved += 1
+
+    @property
+    def idle(self) -> bool:
+        """Whether every source ended and every frame and track waiting was handled, e.g. when replaying files."""
+        return all(not feed.running and len(feed.frames) == 0 and not feed.to_recognize for feed in self.feeds)
+
+    def stop(self) -> None:
+        """Stop the cameras and the shared threads, then save the tracks still open."""
+        self.running = False
+        for feed in self.feeds:
+            feed.stop()
+        self.frame_ready.set()
+        self.track_ready.set()
+        for thread in self.threads:
+            thread.join(timeout=2)
+        self.threads = []
+        for feed in self.feeds:
+            self._save_tracks(feed, feed.tracker.close())
+        self.writer.close(timeout=5)
+
+    def stats(self) -> dict:
+        """
+        :return: The stats of each camera, and of the shared image writer.
+        """
+        return {
+            "cameras": {feed.name: feed.stats() for feed in self.feeds},
+            "writer": self.writer.stats(),
+        }
+
+
+# Run the cameras of a gate
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Capture faces from several cameras in one process.")
+    parser.add_argument("cameras", nargs="+", help="Camera indexes or URLs, video files or image directories")
+    parser.add_argument("--save-dir", default="captured_images")
+    parser.add_argument("--stride", type=int, default=1)
+    parser.add_argument("--recognize", choices=["arrival", "departure"],
+                        help="Register an arrival (or a departure) for every face recognized")
+    args = parser.parse_args()
+
+    recognizer = None
+    if args.recognize:
+        from functools import partial
+        from functions import arrived, departed, log_info
+
+        # No Tk here: the check-ins are logged
+        recognizer = partial(arrived if args.recognize == "arrival" else departed, notify=log_info)
+
+    manager = CaptureManager(
+        {f"camera{i}": camera for i, camera in enumerate(args.cameras)},
+        recognizer=recognizer, save_dir=args.save_dir, stride=args.stride
+    )
+    manager.start()
+    try:
+        while manager.running:
+            time.sleep(5)
+            for name, stats in manager.stats()["cameras"].items():
+                print(f"{name}: {stats['capture_fps']:.1f} fps captured, {stats['processed_fps']:.1f} fps processed, "
+                      f"{stats['dropped']} dropped, {stats['tracks']} tracks, {stats['recognized']} recognized, "
+                      f"{stats['saved']} saved")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manager.stop()
@@ -0,0 +1,209 @@
+import time
+import logging
+import threading
+from collections import deque
+
+
+class EndOfStream(Exception):
+    """Raised by a stage to stop the whole pipeline (e.g. the camera stopped delivering frames)."""
+
+
+class Frame:
+    """
+    A captured frame travelling through the pipeline, enriched by each stage.
+    """
+
+    def __init__(self, index: int, image, timestamp: float | None = None):
+        """
+        :param index: Sequence number of the frame.
+        :param image: The BGR image as read from the camera.
+        :param timestamp: Capture time (time.monotonic()), defaults to now.
+        """
+        self.index = index
+        self.image = image
+        self.timestamp = time.monotonic() if timestamp is None else timestamp
+        self.faces = []
+        self.scores = []
+        self.crops = []
+        self.tracks = []
+
+
+class FrameQueue:
+    """
+    Bounded ring buffer between two stages. When it is full the oldest item is dropped,
+    so a slow consumer always gets the latest frame instead of a backlog of stale ones.
+    """
+
+    def __init__(self, capacity: int = 1):
+        """
+        :param capacity: Maximum number of items kept.
+        """
+        self.capacity = capacity
+        self.items = deque()
+        self.condition = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, item) -> None:
+        with self.condition:
+            if len(self.items) >= self.capacity:
+                self.items.popleft()
+                self.dropped += 1
+            self.items.append(item)
+            self.condition.notify()
+
+    def get(self, timeout: float | None = None):
+        """
+        :return: The oldest item kept, or None on timeout or once the queue is closed.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.items or self.closed, timeout)
+            return self.items.popleft() if self.items else None
+
+    def close(self) -> None:
+        """Wake up the consumer, which then sees an empty queue."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def __len__(self):
+        with self.condition:
+            return len(self.items)
+
+
+class RateMeter:
+    """Events per second over a sliding window."""
+
+    def __init__(self, window: float = 2.0):
+        self.window = window
+        self.events = deque()
+        self.lock = threading.Lock()
+
+    def record(self) -> None:
+        now = time.monotonic()
+        with self.lock:
+            self.events.append(now)
+            while self.events and self.events[0] < now - self.window:
+                self.events.popleft()
+
+    @property
+    def rate(self) -> float:
+        now = time.monotonic()
+        with self.lock:
+            while self.events and self.events[0] < now - self.window:
+                self.events.popleft()
+            return len(self.events) / self.window
+
+
+class Stage:
+    """
+    One step of the pipeline running on its own thread. It takes items from its input queue
+    (or produces them if it has none), applies `work` and hands the result to every downstream
+    stage. Returning None from `work` drops the item.
+    """
+
+    def __init__(self, name: str, work, capacity: int = 1, source: "Stage | None" = None):
+        """
+        :param name: Name used in the stats.
+        :param work: Callable taking the input item (no argument for a source stage).
+        :param capacity: Size of the input queue.
+        :param source: Upstream stage, None for the stage producing the frames.
+        """
+        self.name = name
+        self.work = work
+        self.input = FrameQueue(capacity) if source is not None else None
+        self.outputs = []
+        self.meter = RateMeter()
+        self.processed = 0
+        self.errors = 0
+        self.thread = None
+        self.pipeline = None
+        if source is not None:
+            source.outputs.append(self.input)
+
+    def start(self, pipeline: "Pipeline") -> None:
+        self.pipeline = pipeline
+        self.thread = threading.Thread(target=self._run, name=f"stage-{self.name}", daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        while self.pipeline.running:
+            if self.input is not None:
+                item = self.input.get(timeout=0.1)
+                if item is None:
+                    continue
+            try:
+                result = self.work(item) if self.input is not None else self.work()
+            except EndOfStream:
+                logging.info(f"Pipeline stage '{self.name}' reached the end of the stream.")
+                self.pipeline.stop(wait=False)
+                break
+            except Exception as e:
+                self.errors += 1
+                logging.error(f"Error in pipeline stage '{self.name}': {e}")
+                continue
+
+            self.processed += 1
+            self.meter.record()
+            if result is not None:
+                for output in self.outputs:
+                    output.put(result)
+
+    def stats(self) -> dict:
+        return {
+            "fps": self.meter.rate,
+            "processed": self.processed,
+            "dropped": self.input.dropped if self.input is not None else 0,
+            "queued": len(self.input) if self.input is not None else 0,
+            "errors": self.errors,
+        }
+
+
+class Pipeline:
+    """
+    A chain (or tree) of stages, each on its own thread, connected by latest-frame-wins queues,
+    so every stage runs at its own pace and a slow one never stalls the others.
+    """
+
+    def __init__(self):
+        self.stages = []
+        self.running = False
+        self.on_stop = None
+
+    def add_stage(self, name: str, work, source: Stage | None = None, capacity: int = 1) -> Stage:
+        """
+        Add a stage fed by `source` (or a producing stage when `source` is None).
+        :return: The stage, to be used as the source of the next ones.
+        """
+        stage = Stage(name, work, capacity=capacity, source=source)
+        self.stages.append(stage)
+        return stage
+
+    def start(self) -> None:
+        self.running = True
+        for stage in self.stages:
+            stage.start(self)
+
+    def stop(self, wait: bool = True) -> None:
+        """
+        Stop every stage.
+        :param wait: Join the stage threads (not possible from inside a stage).
+        """
+        if not self.running:
+            return
+        self.running = False
+        for stage in self.stages:
+            if stage.input is not None:
+                stage.input.close()
+        if wait:
+            for stage in self.stages:
+                if stage.thread is not None and stage.thread is not threading.current_thread():
+                    stage.thread.join(timeout=2)
+        if self.on_stop:
+            self.on_stop()
+
+    def stats(self) -> dict:
+        """
+        :return: Per stage FPS, processed, dropped and queued item counts and errors.
+        """
+        return {stage.name: stage.stats() for stage in self.stages}
@@ -0,0 +1,110 @@
+import time
+import threading
+
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+# Size of the preview label
+PREVIEW_WIDTH = 800
+PREVIEW_HEIGHT = 600
+# Frames drawn per second at most, whatever the capture rate
+PREVIEW_MAX_FPS = 15
+
+
+class PreviewRenderer:
+    """
+    Renders camera frames into a Tk label: frames are downscaled to the label size before any
+    conversion, into reused buffers, at a capped rate, and only the latest pending frame is drawn.
+    """
+
+    def __init__(self, root, label, width: int = PREVIEW_WIDTH, height: int = PREVIEW_HEIGHT,
+                 max_fps: float = PREVIEW_MAX_FPS):
+        """
+        :param root: The Tk window, used to schedule the UI updates.
+        :param label: The label displaying the preview.
+        :param width: Width of the preview.
+        :param height: Height of the preview.
+        :param max_fps: Maximum display rate.
+        """
+        self.root = root
+        self.label = label
+        self.width = width
+        self.height = height
+        self.interval = 1.0 / max_fps
+        self.last_render = 0.0
+        # Reused between frames: the letterboxed BGR canvas and the Tk image pasted into
+        self.canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        self.photo = None
+        self.pending = None
+        self.scheduled = False
+        self.rendered = 0
+        self.skipped = 0
+        self.lock = threading.Lock()
+
+    def render(self, image: np.ndarray, annotations=()) -> bool:
+        """
+        Prepare a frame for display, from any thread. Frames over the display rate are skipped.
+        :param image: The full resolution BGR frame, left untouched.
+        :param annotations: (box, label) pairs drawn on the preview, boxes in frame coordinates.
+        :return: Whether the frame was rendered.
+        """
+        now = time.monotonic()
+        if now - self.last_render < self.interval:
+            self.skipped += 1
+            return False
+        self.last_render = now
+
+        height, width = image.shape[:2]
+        scale = min(self.width / width, self.height / height)
+        resized_width, resized_height = int(width * scale), int(height * scale)
+        left, top = (self.width - resized_width) // 2, (self.height - resized_height) // 2
+
+        self.canvas.fill(0)
+        view = self.canvas[top:top + resized_height, left:left + resized_width]
+        cv2.resize(image, (resized_width, resized_height), dst=view, interpolation=cv2.INTER_LINEAR)
+        for (x, y, w, h), label in annotations:
+            x1, y1 = int(x * scale) + left, int(y * scale) + top
+            x2, y2 = int((x + w) * scale) + left, int((y + h) * scale) + top
+            cv2.rectangle(self.canvas, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            if label is not None:
+                cv2.putText(self.canvas, str(label), (x1, max(y1 - 8, 0)), cv2.FONT_HERSHEY_SIMPLEX, 0.6,
+                            (0, 255, 0), 2)
+
+        # fromarray copies the RGB data, the canvas can be reused by the next frame right away
+        preview = Image.fromarray(cv2.cvtColor(self.canvas, cv2.COLOR_BGR2RGB))
+        self.rendered += 1
+
+        with self.lock:
+            self.pending = preview
+            if self.scheduled:
+                return True  # The update already scheduled will draw this newer frame
+            self.scheduled = True
+        self.root.after(0, self._draw)
+        return True
+
+    def _draw(self) -> None:
+        """Draw the latest pending frame, on the Tk thread."""
+        with self.lock:
+            preview, self.pending = self.pending, None
+            self.scheduled = False
+        if preview is None or not self.label.winfo_exists():
+            return
+        if self.photo is None:
+            self.photo = ImageTk.PhotoImage(image=preview)
+            self.label.configure(image=self.photo)
+            self.label.image = self.photo
+        else:
+            self.photo.paste(preview)
+
+    def reset(self) -> None:
+        """Forget the displayed frame, e.g. when the capture stops."""
+        with self.lock:
+            self.pending = None
+        self.photo = None
+
+    def stats(self) -> dict:
+        """
+        :return: Frames rendered and skipped because of the display rate.
+        """
+        return {"rendered": self.rendered, "skipped": self.skipped}
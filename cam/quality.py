@@ -0,0 +1,116 @@
+import cv2
+import numpy as np
+
+# Side of the normalized face patches the quality is measured on
+PATCH_SIZE = 96
+# Laplacian variance (on the normalized patch) considered sharp
+SHARPNESS_TARGET = 150.0
+# Faces blurrier than this Laplacian variance are always rejected
+MIN_SHARPNESS = 20.0
+# Face width, in full resolution pixels, considered large enough
+SIZE_TARGET = 160
+# Faces narrower than this are always rejected
+MIN_FACE_WIDTH = 80
+# Gray level standard deviation considered well contrasted
+CONTRAST_TARGET = 50.0
+# Faces darker or brighter than this mean gray level are always rejected
+BRIGHTNESS_RANGE = (40, 215)
+# Overall score below which a face is not recognized nor saved
+MIN_QUALITY = 0.45
+
+# Weights of each measure in the overall score
+QUALITY_WEIGHTS = {
+    "sharpness": 0.35,
+    "size": 0.2,
+    "brightness": 0.1,
+    "contrast": 0.1,
+    "frontalness": 0.25,
+}
+
+
+class LowQualityFace(ValueError):
+    """
+    A face too blurry, small, badly lit or turned away to be recognized or saved.
+    """
+
+    def __init__(self, score: float, min_quality: float = MIN_QUALITY):
+        super().__init__(f"Face quality too low ({score:.2f} < {min_quality:.2f}): "
+                         f"face the camera, closer and in good light.")
+        self.score = score
+
+
+def _patches(image: np.ndarray, boxes) -> np.ndarray:
+    """
+    Stack the faces of a frame as gray PATCH_SIZE x PATCH_SIZE float patches.
+    :return: An array of shape (n, PATCH_SIZE, PATCH_SIZE).
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    patches = np.empty((len(boxes), PATCH_SIZE, PATCH_SIZE), dtype=np.float32)
+    for i, (x, y, w, h) in enumerate(boxes):
+        face = gray[max(y, 0):y + h, max(x, 0):x + w]
+        patches[i] = cv2.resize(face, (PATCH_SIZE, PATCH_SIZE), interpolation=cv2.INTER_AREA)
+    return patches
+
+
+def measure_faces(image: np.ndarray, boxes) -> dict[str, np.ndarray]:
+    """
+    Raw quality measures of the faces of a frame, computed on all of them at once.
+    :param image: The full resolution BGR frame.
+    :param boxes: The (x, y, w, h) face boxes.
+    :return: Arrays of per face sharpness (Laplacian variance), width, brightness (mean gray level),
+             contrast (gray level standard deviation) and frontalness (left/right symmetry, 0 to 1).
+    """
+    boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+    patches = _patches(image, boxes)
+
+    # 4-neighbour Laplacian of every patch at once
+    laplacian = (patches[:, :-2, 1:-1] + patches[:, 2:, 1:-1] + patches[:, 1:-1, :-2] + patches[:, 1:-1, 2:]
+                 - 4 * patches[:, 1:-1, 1:-1])
+
+    # A face looking at the camera is roughly symmetric: correlate each half with the mirrored other half
+    half = PATCH_SIZE // 2
+    left = patches[:, :, :half].reshape(len(boxes), -1)
+    right = patches[:, :, :-half - 1:-1].reshape(len(boxes), -1)
+    left = left - left.mean(axis=1, keepdims=True)
+    right = right - right.mean(axis=1, keepdims=True)
+    correlation = (left * right).sum(axis=1) / np.maximum(
+        np.linalg.norm(left, axis=1) * np.linalg.norm(right, axis=1), 1e-6)
+
+    return {
+        "sharpness": laplacian.reshape(len(boxes), -1).var(axis=1),
+        "width": boxes[:, 2].astype(np.float32),
+        "brightness": patches.reshape(len(boxes), -1).mean(axis=1),
+        "contrast": patches.reshape(len(boxes), -1).std(axis=1),
+        "frontalness": np.clip(correlation, 0.0, 1.0),
+    }
+
+
+def quality_scores(measures: dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Combine the raw measures into a score between 0 and 1, 0 for faces failing a hard limit.
+    """
+    brightness = measures["brightness"]
+    normalized = {
+        "sharpness": np.minimum(measures["sharpness"] / SHARPNESS_TARGET, 1.0),
+        "size": np.minimum(measures["width"] / SIZE_TARGET, 1.0),
+        "brightness": 1.0 - np.abs(brightness - 127.5) / 127.5,
+        "contrast": np.minimum(measures["contrast"] / CONTRAST_TARGET, 1.0),
+        "frontalness": measures["frontalness"],
+    }
+    scores = sum(weight * normalized[name] for name, weight in QUALITY_WEIGHTS.items())
+
+    low, high = BRIGHTNESS_RANGE
+    usable = ((measures["width"] >= MIN_FACE_WIDTH) & (measures["sharpness"] >= MIN_SHARPNESS)
+              & (brightness >= low) & (brightness <= high))
+    return np.where(usable, scores, 0.0).astype(np.float32)
+
+
+def score_faces(image: np.ndarray, boxes) -> np.ndarray:
+    """
+    Quality score (0 to 1) of each face of a frame, compare it to MIN_QUALITY to reject a face.
+    :param image: The full resolution BGR frame.
+    :param boxes: The (x, y, w, h) face boxes.
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.float32)
+    return quality_scores(measure_faces(image, boxes))
@@ -3,6 +3,9 @@ import os
 import time
 from datetime import datetime
 
+from cam.writer import ImageWriter
+from cam.source import open_source
+
 
 class CameraCapture:
     def __init__(self, save_dir="captured_images", camera_index=0):
@@ -10,11 +13,13 @@ class CameraCapture:
         Initialize the camera capture class.
 
         :param save_dir: Directory to save captured images.
-        :param camera_index: Index of the camera to use (default is 0 for the default camera).
+        :param camera_index: Index of the camera to use (default is 0 for the default camera), or any source
+                             accepted by `cam.source.open_source`.
         """
         self.save_dir = save_dir
         self.camera_index = camera_index
         self.camera = None
+        self.writer = None
 
         # Create the directory if it doesn't exist
         if not os.path.exists(self.save_dir):
@@ -33,11 +38,12 @@ class CameraCapture:
         """
         Start the camera feed and save images every second until 'q' is pressed.
         """
-        self.camera = cv2.VideoCapture(self.camera_index)
+        self.camera = open_source(self.camera_index)
 
-        if not self.camera.isOpened():
+        if not self.camera.open():
             print("Error: Could not open camera.")
             return
+        self.writer = ImageWriter()
 
         print("Press 'q' to quit.")
         try:
@@ -52,10 +58,10 @@ class CameraCapture:
                 # Display the frame in a window
                 cv2.imshow("Camera Feed", frame)
 
-                # Save the frame as an image file
+                # Save the frame as an image file, in the background
                 filename = self._generate_filename()
-                cv2.imwrite(filename, frame)
-                print(f"Image saved: {filename}")
+                if self.writer.submit(filename, frame):
+                    print(f"Image saved: {self.writer.path_for(filename)}")
 
                 # Wait for 1 second before capturing the next frame
                 time.sleep(1)
@@ -68,10 +74,12 @@ class CameraCapture:
 
     def stop(self):
         """
-        Release the camera and close the OpenCV window.
+        Release the camera, close the OpenCV window and wait for the images still being written.
         """
         if self.camera is not None:
             self.camera.release()
+        if self.writer is not None:
+            self.writer.close(timeout=5)
         cv2.destroyAllWindows()
         print("Camera released. Program ended.")
 
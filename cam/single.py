@@ -3,6 +3,11 @@ import os
 import uuid
 
 from functions import arrived, departed
+from cam.detector import FaceDetector, crop_face
+from cam.quality import score_faces, LowQualityFace, MIN_QUALITY
+from cam.writer import ImageWriter, BLOCK
+from cam.source import open_source
+from recognition.crop import FaceCrop
 
 class SinglePictureCapture:
     """
@@ -10,24 +15,37 @@ class SinglePictureCapture:
     and process the captured image.
     """
 
-    def __init__(self, save_directory: str = "captured_images"):
+    def __init__(self, save_directory: str = "captured_images", camera=0, min_quality: float = MIN_QUALITY):
         """
         Initialize the class with the directory to save captured images.
 
         :param save_directory: Directory to save the captured images.
+        :param camera: Index of the camera (default camera by default), or any source accepted by
+                       `cam.source.open_source`.
+        :param min_quality: Quality score (see `cam.quality`) the face needs to be recognized.
         """
         self.save_directory = save_directory
+        self.camera = camera
+        self.min_quality = min_quality
+        self.detector = FaceDetector()
+        # Only opened when a picture has to be written
+        self.writer = None
+        self.crop = None
         if not os.path.exists(self.save_directory):
             os.makedirs(self.save_directory)
 
     def capture_image(self) -> str:
         """
-        Captures a single image using the webcam and saves it.
+        Captures a single image using the webcam.
+        The largest face of the image is kept in `self.crop`; the image is only saved
+        when no face was detected, for the recognition to look for one in the file.
+        A picture whose faces are all too poor is neither kept nor saved: take another one.
 
-        :return: The file path of the saved image.
+        :return: The file path of the saved image, "" when none was saved.
         """
-        cap = cv2.VideoCapture(0)  # Open the default camera
-        if not cap.isOpened():
+        self.crop = None
+        cap = open_source(self.camera)
+        if not cap.open():
             raise RuntimeError("Failed to open the webcam.")
 
         print("Press 's' to capture the image or 'q' to quit.")
@@ -42,10 +60,20 @@ class SinglePictureCapture:
 
             key = cv2.waitKey(1) & 0xFF
             if key == ord('s'):  # Press 's' to capture the image
-                file_name = f"{uuid.uuid4()}.jpg"
-                file_path = os.path.join(self.save_directory, file_name)
-                cv2.imwrite(file_path, frame)
-                print(f"Image saved as {file_path}")
+                try:
+                    self.crop = self.detect_crop(frame)
+                except LowQualityFace as e:
+                    print(f"{e} Press 's' to try again.")
+                    continue
+                file_path = ""
+                if self.crop is None:
+                    file_name = f"{uuid.uuid4()}.jpg"
+                    # The only picture taken must not be dropped
+                    self.writer = ImageWriter(workers=1, policy=BLOCK)
+                    file_path = self.writer.path_for(os.path.join(self.save_directory, file_name))
+                    # Written in the background while the camera is released
+                    self.writer.submit(file_path, frame)
+                    print(f"Image saved as {file_path}")
                 cap.release()
                 cv2.destroyAllWindows()
                 return file_path
@@ -55,36 +83,63 @@ class SinglePictureCapture:
                 cv2.destroyAllWindows()
                 return ""
 
+    def detect_crop(self, frame) -> FaceCrop | None:
+        """
+        Detect the largest face of a frame good enough to be recognized.
+
+        :param frame: The BGR frame.
+        :return: The face crop, None if there is no face.
+        :raise LowQualityFace: If faces were found but none reaches `min_quality`.
+        """
+        faces = self.detector.detect(frame)
+        if len(faces) == 0:
+            return None
+        scores = score_faces(frame, faces)
+        good = [(box, score) for box, score in zip(faces, scores) if score >= self.min_quality]
+        if not good:
+            raise LowQualityFace(float(scores.max()), self.min_quality)
+        box, _ = max(good, key=lambda item: item[0][2] * item[0][3])
+        return FaceCrop(crop_face(frame, box), box)
+
     @staticmethod
-    def process_image(image_path: str, arrive: bool) -> None:
+    def process_image(image_path: str, arrive: bool, crop: FaceCrop | None = None) -> None:
         """
         Processes the captured image and deletes it after processing.
 
         :param image_path: The file path of the captured image.
         :param arrive: Whether the captured image is arrived or departed one.
+        :param crop: The face already detected in the image, recognized instead of the file
+                     so the face is not detected twice.
         """
-        if image_path:
-            print(f"Processing the image at {image_path}...")
-            try:
-                if arrive:
-                    arrived(image_path)
-                else:
-                    departed(image_path)
-                print(f"Processing complete for {image_path}.")
-            finally:
-                # Delete the file after processing
-                if os.path.exists(image_path):
-                    os.remove(image_path)
-                    print(f"Deleted the image at {image_path}.")
-        else:
+        if crop is None and not image_path:
             print("No image to process.")
+            return
+        source = image_path or "the detected face"
+        print(f"Processing {source}...")
+        try:
+            profile = crop if crop is not None else image_path
+            if arrive:
+                arrived(profile)
+            else:
+                departed(profile)
+            print(f"Processing complete for {source}.")
+        finally:
+            # Delete the file after processing
+            if image_path and os.path.exists(image_path):
+                os.remove(image_path)
+                print(f"Deleted the image at {image_path}.")
 
     def run(self, arrive: bool) -> None:
         """
         Runs the entire process of capturing and processing an image.
         """
         image_path = self.capture_image()
-        self.process_image(f"./{image_path}", arrive)
+        if image_path:
+            # The image must be on disk before it is processed and deleted
+            self.writer.close(timeout=None)
+            self.writer = None
+            image_path = f"./{image_path}"
+        self.process_image(image_path, arrive, self.crop)
 
 
 # Example usage
@@ -0,0 +1,185 @@
+import os
+import abc
+import time
+
+import cv2
+
+# Extensions read by ImageDirectorySource
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+# Frame rate of a directory of images played in real time, like a typical camera
+IMAGE_DIRECTORY_FPS = 30.0
+
+
+class FrameSource(abc.ABC):
+    """
+    Where the capture code gets its frames from: a live camera, a recorded video or a directory of images.
+    Recorded sources are played at real-time speed, at a fixed frame rate or as fast as possible,
+    so the pipeline can be benchmarked and regression-tested without a camera.
+    """
+
+    def __init__(self, fps: float | None = None):
+        """
+        :param fps: Frames per second to deliver at most, None to deliver them as fast as they come.
+        """
+        self.fps = fps
+        self.started_at = None
+        self.delivered = 0
+
+    @abc.abstractmethod
+    def open(self) -> bool:
+        """
+        Open the source (idempotent).
+        :return: Whether frames can be read.
+        """
+
+    @abc.abstractmethod
+    def _read(self):
+        """
+        Read the next frame, unpaced.
+        :return: A tuple (True, BGR image), or (False, None) at the end of the source.
+        """
+
+    def read(self):
+        """
+        Read the next frame, paced to the source frame rate.
+        :return: A tuple (True, BGR image), or (False, None) at the end of the source.
+        """
+        ret, image = self._read()
+        if not ret:
+            return False, None
+        if self.fps:
+            if self.started_at is None:
+                self.started_at = time.monotonic()
+            delay = self.started_at + self.delivered / self.fps - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        self.delivered += 1
+        return True, image
+
+    def release(self) -> None:
+        """Release the underlying device or file."""
+
+
+class CameraSource(FrameSource):
+    """A live camera, paced by the device itself."""
+
+    def __init__(self, camera: int | str = 0):
+        """
+        :param camera: Index or URL of the camera, as accepted by `cv2.VideoCapture`.
+        """
+        super().__init__()
+        self.camera = camera
+        self.capture = None
+
+    def open(self) -> bool:
+        if self.capture is None or not self.capture.isOpened():
+            self.capture = cv2.VideoCapture(self.camera)
+        return self.capture.isOpened()
+
+    def _read(self):
+        return self.capture.read()
+
+    def release(self) -> None:
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+
+class VideoFileSource(FrameSource):
+    """A recorded video file."""
+
+    def __init__(self, path: str, realtime: bool = True, fps: float | None = None, loop: bool = False):
+        """
+        :param path: Path to the video.
+        :param realtime: Play at the frame rate of the video, like a camera would deliver it.
+        :param fps: Play at this frame rate instead (overrides `realtime`).
+        :param loop: Start again at the end of the video.
+        """
+        super().__init__(fps)
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        self.capture = None
+
+    def open(self) -> bool:
+        if self.capture is None:
+            if not os.path.isfile(self.path):
+                return False
+            self.capture = cv2.VideoCapture(self.path)
+            if self.fps is None and self.realtime:
+                self.fps = self.capture.get(cv2.CAP_PROP_FPS) or None
+        return self.capture.isOpened()
+
+    def _read(self):
+        ret, image = self.capture.read()
+        if not ret and self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, image = self.capture.read()
+        return ret, image
+
+    def release(self) -> None:
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+
+class ImageDirectorySource(FrameSource):
+    """The images of a directory, in name order."""
+
+    def __init__(self, path: str, realtime: bool = True, fps: float | None = None, loop: bool = False):
+        """
+        :param path: Path to the directory.
+        :param realtime: Deliver the images at IMAGE_DIRECTORY_FPS, like a camera would (False delivers them
+                         as fast as possible).
+        :param fps: Deliver the images at this frame rate instead (overrides `realtime`).
+        :param loop: Start again after the last image.
+        """
+        super().__init__(fps if fps is not None or not realtime else IMAGE_DIRECTORY_FPS)
+        self.realtime = realtime
+        self.path = path
+        self.loop = loop
+        self.files = None
+        self.position = 0
+
+    def open(self) -> bool:
+        if self.files is None:
+            if not os.path.isdir(self.path):
+                return False
+            self.files = sorted(
+                os.path.join(self.path, name) for name in os.listdir(self.path)
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        return bool(self.files)
+
+    def _read(self):
+        while True:
+            if self.position >= len(self.files):
+                if not self.loop:
+                    return False, None
+                self.position = 0
+            image = cv2.imread(self.files[self.position])
+            self.position += 1
+            if image is not None:
+                return True, image
+
+
+def open_source(source: int | str | FrameSource, realtime: bool = True, fps: float | None = None,
+                loop: bool = False) -> FrameSource:
+    """
+    Build the frame source matching a camera index, camera URL, video file or image directory.
+    :param source: The source specification, or an already built FrameSource returned as is.
+    :param realtime: Play recorded videos at their own frame rate and image directories at IMAGE_DIRECTORY_FPS
+                     (False plays them as fast as possible).
+    :param fps: Fixed frame rate for recorded sources.
+    :param loop: Replay recorded sources from the start when they end.
+    """
+    if isinstance(source, FrameSource):
+        return source
+    if isinstance(source, int) or (isinstance(source, str) and source.isdigit()):
+        return CameraSource(int(source))
+    if os.path.isdir(source):
+        return ImageDirectorySource(source, realtime=realtime, fps=fps, loop=loop)
+    if os.path.isfile(source):
+        return VideoFileSource(source, realtime=realtime, fps=fps, loop=loop)
+    # Anything else (e.g. an RTSP URL) is left to OpenCV
+    return CameraSource(source)
@@ -0,0 +1,198 @@
+import threading
+import itertools
+
+import numpy as np
+
+
+def iou_matrix(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """
+    Intersection over union of every pair of (x, y, w, h) boxes.
+    :return: A matrix of shape (len(first), len(second)).
+    """
+    first = np.asarray(first, dtype=np.float32).reshape(-1, 4)
+    second = np.asarray(second, dtype=np.float32).reshape(-1, 4)
+    x1 = np.maximum(first[:, None, 0], second[None, :, 0])
+    y1 = np.maximum(first[:, None, 1], second[None, :, 1])
+    x2 = np.minimum(first[:, None, 0] + first[:, None, 2], second[None, :, 0] + second[None, :, 2])
+    y2 = np.minimum(first[:, None, 1] + first[:, None, 3], second[None, :, 1] + second[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    areas_first = first[:, 2] * first[:, 3]
+    areas_second = second[:, 2] * second[:, 3]
+    union = areas_first[:, None] + areas_second[None, :] - intersection
+    return intersection / np.maximum(union, 1e-9)
+
+
+def centroid_distance_matrix(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """
+    Distance between the centers of every pair of boxes, relative to the size of the first box.
+    """
+    first = np.asarray(first, dtype=np.float32).reshape(-1, 4)
+    second = np.asarray(second, dtype=np.float32).reshape(-1, 4)
+    centers_first = first[:, :2] + first[:, 2:] / 2
+    centers_second = second[:, :2] + second[:, 2:] / 2
+    distances = np.linalg.norm(centers_first[:, None, :] - centers_second[None, :, :], axis=2)
+    return distances / np.maximum(first[:, None, 2:].mean(axis=2), 1.0)
+
+
+def _greedy_pairs(scores: np.ndarray, accept) -> list[tuple[int, int]]:
+    """
+    Pair rows and columns best score first, each row and column used once.
+    :param scores: Higher is better.
+    :param accept: Whether a score is good enough to pair.
+    """
+    scores = scores.astype(np.float64, copy=True)
+    pairs = []
+    while scores.size:
+        row, column = np.unravel_index(np.argmax(scores), scores.shape)
+        if not accept(scores[row, column]):
+            break
+        pairs.append((int(row), int(column)))
+        scores[row, :] = -np.inf
+        scores[:, column] = -np.inf
+    return pairs
+
+
+class Track:
+    """
+    One person followed across frames. Keeps the best face image seen so far and,
+    once recognized, the identity for the rest of the track.
+    """
+
+    def __init__(self, track_id: int, box, image, score: float):
+        self.id = track_id
+        self.box = tuple(int(value) for value in box)
+        self.hits = 1
+        self.misses = 0
+        self.best_image = image
+        self.best_box = self.box
+        self.best_score = score
+        self.identity = None
+        self.recognition_requested = False
+
+    def update(self, box, image, score: float) -> None:
+        self.box = tuple(int(value) for value in box)
+        self.hits += 1
+        self.misses = 0
+        if score > self.best_score:
+            self.best_image = image
+            self.best_box = self.box
+            self.best_score = score
+
+
+class FaceTracker:
+    """
+    Lightweight tracker giving face detections stable ids across frames: detections are
+    matched to tracks by IoU, then by centroid distance for faces that moved fast.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_centroid_distance: float = 0.6, max_misses: int = 10,
+                 min_hits: int = 5, min_score: float = 0.0):
+        """
+        :param iou_threshold: Minimum IoU to continue a track.
+        :param max_centroid_distance: Maximum center distance (in face widths) to continue a track.
+        :param max_misses: Frames a track survives without a detection.
+        :param min_hits: Detections needed before a track is worth recognizing.
+        :param min_score: Best detection score needed before a track is worth recognizing or keeping.
+        """
+        self.iou_threshold = iou_threshold
+        self.max_centroid_distance = max_centroid_distance
+        self.max_misses = max_misses
+        self.min_hits = min_hits
+        self.min_score = min_score
+        self.tracks = []
+        self.finished = []
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def update(self, boxes, images, scores=None) -> list[Track]:
+        """
+        Feed the detections of a new frame.
+        :param boxes: Detected (x, y, w, h) boxes.
+        :param images: The image of each detection (e.g. its crop), kept if it is the best of its track.
+        :param scores: How good each detection is for recognition, e.g. its quality (defaults to the face area).
+        :return: The tracks seen in this frame.
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        if scores is None:
+            scores = boxes[:, 2] * boxes[:, 3]
+
+        with self.lock:
+            current = np.array([track.box for track in self.tracks], dtype=np.float32).reshape(-1, 4)
+            pairs = _greedy_pairs(iou_matrix(current, boxes), lambda iou: iou >= self.iou_threshold)
+
+            matched_rows = {row for row, _ in pairs}
+            matched_columns = {column for _, column in pairs}
+            unmatched_tracks = [row for row in range(len(self.tracks)) if row not in matched_rows]
+            unmatched_boxes = [column for column in range(len(boxes)) if column not in matched_columns]
+            if unmatched_tracks and unmatched_boxes:
+                distances = centroid_distance_matrix(current[unmatched_tracks], boxes[unmatched_boxes])
+                for row, column in _greedy_pairs(-distances, lambda d: -d <= self.max_centroid_distance):
+                    pairs.append((unmatched_tracks[row], unmatched_boxes[column]))
+
+            seen = []
+            for row, column in pairs:
+                self.tracks[row].update(boxes[column], images[column], float(scores[column]))
+                seen.append(self.tracks[row])
+
+            matched_tracks = {row for row, _ in pairs}
+            matched_boxes = {column for _, column in pairs}
+            for column in range(len(boxes)):
+                if column not in matched_boxes:
+                    track = Track(next(self.ids), boxes[column], images[column], float(scores[column]))
+                    self.tracks.append(track)
+                    seen.append(track)
+
+            alive = []
+            for row, track in enumerate(self.tracks):
+                if row >= len(current) or row in matched_tracks:
+                    alive.append(track)
+                    continue
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    self.finished.append(track)
+                else:
+                    alive.append(track)
+            self.tracks = alive
+            return seen
+
+    def active(self) -> list[Track]:
+        """
+        The open tracks.
+        """
+        with self.lock:
+            return list(self.tracks)
+
+    def tracks_to_recognize(self) -> list[Track]:
+        """
+        Tracks seen long enough, with a good enough image and not recognized yet. They are marked as requested,
+        so each track is handed out once.
+        """
+        with self.lock:
+            ready = [track for track in self.tracks if self.is_usable(track) and not track.recognition_requested]
+            for track in ready:
+                track.recognition_requested = True
+            return ready
+
+    def is_usable(self, track: Track) -> bool:
+        """
+        Whether a track was seen long enough, with a good enough image, to be recognized or kept.
+        """
+        return track.hits >= self.min_hits and track.best_score >= self.min_score
+
+    def pop_finished(self) -> list[Track]:
+        """
+        Tracks that ended since the last call.
+        """
+        with self.lock:
+            finished, self.finished = self.finished, []
+            return finished
+
+    def close(self) -> list[Track]:
+        """
+        End every open track.
+        :return: All the tracks that ended and were not popped yet.
+        """
+        with self.lock:
+            self.finished.extend(self.tracks)
+            self.tracks = []
+        return self.pop_finished()
@@ -0,0 +1,187 @@
+import os
+import time
+import queue
+import logging
+import threading
+
+import cv2
+
+# Images waiting to be written before the drop policy applies
+WRITER_CAPACITY = 32
+# Threads encoding and writing images
+WRITER_WORKERS = 2
+# JPEG quality (0-100) of the saved images
+JPEG_QUALITY = 90
+# How long `submit` waits for room with the "block" policy, in seconds
+BLOCK_TIMEOUT = 0.5
+
+# What to do with a new image when the queue is full
+DROP_OLDEST = "drop_oldest"  # Replace the oldest waiting image, the capture loop never waits
+DROP_NEWEST = "drop_newest"  # Refuse the new image, the capture loop never waits
+BLOCK = "block"  # Wait up to BLOCK_TIMEOUT for room (back-pressure), then refuse the new image
+POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+
+class ImageWriter:
+    """
+    Encodes and writes captured images on background threads, so slow storage never blocks the capture loop.
+    """
+
+    def __init__(self, capacity: int = WRITER_CAPACITY, workers: int = WRITER_WORKERS, quality: int = JPEG_QUALITY,
+                 image_format: str = ".jpg", policy: str = DROP_OLDEST):
+        """
+        :param capacity: Images waiting to be written before the drop policy applies.
+        :param workers: Number of writer threads.
+        :param quality: JPEG (or WebP) quality, 0 to 100.
+        :param image_format: Extension of the encoding, e.g. ".jpg", ".png" or ".webp".
+        :param policy: DROP_OLDEST, DROP_NEWEST or BLOCK.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown drop policy: {policy}")
+        self.queue = queue.Queue(maxsize=capacity)
+        self.image_format = image_format
+        self.policy = policy
+        self.params = {
+            ".jpg": [cv2.IMWRITE_JPEG_QUALITY, quality],
+            ".jpeg": [cv2.IMWRITE_JPEG_QUALITY, quality],
+            ".webp": [cv2.IMWRITE_WEBP_QUALITY, quality],
+        }.get(image_format.lower(), [])
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.closed = False
+        self.lock = threading.Lock()  # Counters
+        # Held by `submit` from the closed check to the queueing, and by `close` to set `closed`: nothing is
+        # queued (or discarded by DROP_OLDEST, which could take a stop sentinel) once the sentinels go in
+        self.submit_lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def path_for(self, path: str) -> str:
+        """
+        The path an image is written to: `path` with the extension of the writer format.
+        """
+        return os.path.splitext(path)[0] + self.image_format
+
+    def submit(self, path: str, image) -> bool:
+        """
+        Queue an image to be written. The image must not be modified afterwards.
+        :param path: Destination, its extension is replaced by the writer format.
+        :param image: The BGR image.
+        :return: Whether the image was queued (False when dropped by the policy or once closed).
+        """
+        item = (self.path_for(path), image)
+        with self.submit_lock:
+            if self.closed:
+                return self._drop()
+            return self._queue(item)
+
+    def _queue(self, item: tuple) -> bool:
+        """Queue an item according to the drop policy. `submit_lock` held."""
+        if self.policy == BLOCK:
+            try:
+                self.queue.put(item, timeout=BLOCK_TIMEOUT)
+                return True
+            except queue.Full:
+                return self._drop()
+
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except queue.Full:
+            if self.policy == DROP_NEWEST:
+                return self._drop()
+
+        # DROP_OLDEST: make room by discarding the image waiting the longest
+        while True:
+            try:
+                self.queue.get_nowait()
+                self.queue.task_done()
+                self._drop()
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(item)
+                return True
+            except queue.Full:
+                continue
+
+    def _drop(self) -> bool:
+        with self.lock:
+            self.dropped += 1
+        return False
+
+    def _run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break  # Closed
+            path, image = item
+            try:
+                self._write(path, image)
+                with self.lock:
+                    self.written += 1
+            except Exception as e:
+                with self.lock:
+                    self.errors += 1
+                logging.error(f"Error writing image {path}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _write(self, path: str, image) -> None:
+        ok, encoded = cv2.imencode(self.image_format, image, self.params)
+        if not ok:
+            raise ValueError(f"Could not encode the image as {self.image_format}.")
+        # Written under a temporary name first, so a reader never sees a partial image
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "wb") as file:
+            file.write(encoded.tobytes())
+        os.replace(temporary_path, path)
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        Wait for the queued images to be written, e.g. on shutdown.
+        :param timeout: Maximum wait in seconds, None to wait for all of them.
+        :return: Whether every queued image was handled.
+        """
+        if timeout is None:
+            self.queue.join()
+            return True
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout: float | None = 5.0) -> bool:
+        """
+        Write the queued images and stop the writer threads. The images submitted afterwards are dropped.
+        :param timeout: Maximum wait in seconds for the queued images, then for the threads, None to wait for all.
+        :return: Whether every queued image was handled.
+        """
+        with self.submit_lock:
+            if self.closed:
+                return True
+            self.closed = True
+        flushed = self.flush(timeout)
+        # One sentinel per thread, queued behind the images still waiting if the flush timed out
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join(timeout=timeout)
+        return flushed
+
+    def stats(self) -> dict:
+        """
+        :return: Images written, dropped, failed and waiting.
+        """
+        with self.lock:
+            return {
+                "written": self.written,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "queued": self.queue.qsize(),
+            }
@@ -1,28 +1,111 @@
 """
 This file is used for the setup of our database and the creation
 of tables.
-We make accessible a session instance at the end.
+We make accessible a session at the end: `session` for the writes and
+`read_session` for the reads, each scoped to the calling thread (or request).
 """
 
+import functools
+
 from models import Base
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from migrations import migrate
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker, scoped_session
 
 # Define the SQLite database URL
 DATABASE_URL = "sqlite:///frs.sqlite"
 
-# Create the database engine
-engine = create_engine(DATABASE_URL)
+# How long a connection waits for a lock held by another process (or for the writer
+# connection held by another thread) before failing, in seconds
+BUSY_TIMEOUT = 10
+
+# Read connections kept open, about one per concurrent API request or UI thread,
+# and how many more may be opened under bursts
+READ_POOL_SIZE = 8
+READ_POOL_OVERFLOW = 8
+
+
+def _configure_connection(dbapi_connection, connection_record):
+    """
+    Tune every new SQLite connection: WAL lets the readers work while a write is in progress,
+    NORMAL synchronous only syncs at checkpoints (safe in WAL mode), and the busy timeout makes
+    a connection wait for a lock instead of failing with "database is locked".
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT * 1000}")
+    cursor.close()
+
+
+def _configure_read_connection(dbapi_connection, connection_record):
+    _configure_connection(dbapi_connection, connection_record)
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
 
-# Create all tables defined in models
+# SQLite has a single writer anyway: every write goes through one pooled connection,
+# so concurrent writers queue in the pool instead of failing on the database lock
+writer_engine = create_engine(
+    DATABASE_URL,
+    pool_size=1,
+    max_overflow=0,
+    pool_timeout=BUSY_TIMEOUT,
+    connect_args={"check_same_thread": False, "timeout": BUSY_TIMEOUT},
+)
+event.listen(writer_engine, "connect", _configure_connection)
+
+# The reads use their own pool of read-only connections, never waiting for the writer
+reader_engine = create_engine(
+    DATABASE_URL,
+    pool_size=READ_POOL_SIZE,
+    max_overflow=READ_POOL_OVERFLOW,
+    pool_timeout=BUSY_TIMEOUT,
+    connect_args={"check_same_thread": False, "timeout": BUSY_TIMEOUT},
+)
+event.listen(reader_engine, "connect", _configure_read_connection)
+
+# Kept for the code creating and migrating the tables
+engine = writer_engine
+
+# Upgrade an existing database in place, then create the tables it does not have yet
+migrate(engine.url.database)
 Base.metadata.create_all(engine)
 
 print("Database and tables created!")
 
-# Create a configured "Session" class
-Session = sessionmaker(bind=engine)
+# Create the configured "Session" classes
+Session = sessionmaker(bind=writer_engine)
+ReadSession = sessionmaker(bind=reader_engine)
 
-# Create a session instance to be used
-session = Session()
+# Thread-local sessions: `session.query(...)`, `session.commit()` and so on act on the session of
+# the calling thread. A write must end with a commit (or rollback) to hand the writer connection back.
+session = scoped_session(Session)
+read_session = scoped_session(ReadSession)
 
 print("Session instance created!")
+
+
+def remove_sessions(exception=None) -> None:
+    """
+    Close the sessions of the calling thread, e.g. at the end of a Flask request.
+    Uncommitted changes are rolled back and the connections return to their pools.
+    """
+    session.remove()
+    read_session.remove()
+
+
+def read_only(function):
+    """
+    Decorator for functions reading through `read_session`: the read session is closed when
+    the function returns, so its connection goes back to the pool and the next call sees fresh data.
+    Returned ORM objects stay usable with the attributes already loaded.
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        finally:
+            read_session.remove()
+    return wrapper
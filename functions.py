@@ -1,171 +1,321 @@
-import os
 import uuid
-import tempfile
+import logging
+import threading
+from typing import Callable
 
-from database import session
+from database import session, read_session, read_only
 from tkinter import messagebox
-from recognition.compare import compare_face
+from recognition.compare import compare_face, compare_faces
+from cam.quality import LowQualityFace
+from attendance import get_attendance_queue
+from presence import get_presence_index
 from datetime import timedelta, datetime, date
+from sqlalchemy import func, case, and_
 from recognition.functions import upload_profile
-from models import Operator, Profile, Arrival, Departure
-
-
-def save_temp_file(profile) -> str:
-    """
-    Saves a byte array as a temporary file and returns the file path.
-    """
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_file:
-        temp_file.write(profile)
-        return temp_file.name
+from recognition.store import make_record, publish_embeddings
+from models import Operator, Profile, Arrival, Departure, AttendanceDaily
 
 
 def register(name: str, phone: str, email: str, password: str, post: str, profile) -> bool:
     operator_id = str(uuid.uuid4())
 
-    if isinstance(profile, bytes):
-        temp_image_path = save_temp_file(profile)
-        path = upload_profile(operator_id, temp_image_path)
-        os.remove(temp_image_path)
-    else:
-        path = upload_profile(operator_id, profile)
+    path = upload_profile(operator_id, profile)
+    if path["status"] != "success":
+        raise ValueError(path["message"])
 
     operator = Operator(id=operator_id, name=name, phone=phone, email=email, password=password, post=post)
     profile = Profile(operator_id=operator_id, profile_path=path["profile_path"], processed=True)
-    session.add_all([operator, profile])
-    session.commit()
+    embedding = make_record(operator_id, path["profile_path"], path["embedding"])
+    try:
+        session.add_all([operator, profile, embedding])
+        session.commit()
+    except Exception:
+        session.rollback()  # e.g. an email already used, the writer connection is handed back
+        raise
+    publish_embeddings([embedding.id], path["embedding"])
+    get_presence_index().add_operator(operator_id)
 
     messagebox.showinfo("Info", f"Created the operator {operator.to_dict()} and their profile {profile.to_dict()}")
     return True
 
 
 def update(operator_id: str, name: str, phone: str, email: str, password: str, post: str, profile) -> bool:
-    operator = session.query(Operator).filter_by(id=operator_id).first()
-    if not operator:
+    exists = read_session.query(Operator.id).filter_by(id=operator_id).first()
+    read_session.remove()
+    if not exists:
         raise ValueError(f"No operator found with ID {operator_id}")
 
-    operator.name = name
-    operator.phone = phone
-    operator.email = email
-    operator.password = password
-    operator.post = post
-
-    if isinstance(profile, bytes):
-        temp_image_path = save_temp_file(profile)
-        path = upload_profile(operator_id, temp_image_path)
-        os.remove(temp_image_path)
-    else:
-        path = upload_profile(operator_id, profile)
-
-    profile_record = session.query(Profile).filter_by(operator_id=operator_id).first()
-    if profile_record:
-        profile_record.profile_path = path["profile_path"]
-    else:
-        profile_record = Profile(operator_id=operator_id, profile_path=path["profile_path"], processed=True)
-        session.add(profile_record)
-
-    session.commit()
+    # Embedded and saved before the writer session is used: the inference can take seconds
+    # and must not hold the only writer connection meanwhile
+    path = upload_profile(operator_id, profile)
+    if path["status"] != "success":
+        raise ValueError(path["message"])
+
+    try:
+        operator = session.query(Operator).filter_by(id=operator_id).first()
+        if not operator:
+            raise ValueError(f"No operator found with ID {operator_id}")
+
+        operator.name = name
+        operator.phone = phone
+        operator.email = email
+        operator.password = password
+        operator.post = post
+
+        profile_record = session.query(Profile).filter_by(operator_id=operator_id).first()
+        if profile_record:
+            profile_record.profile_path = path["profile_path"]
+        else:
+            profile_record = Profile(operator_id=operator_id, profile_path=path["profile_path"], processed=True)
+            session.add(profile_record)
+        embedding = make_record(operator_id, path["profile_path"], path["embedding"])
+        session.add(embedding)
+
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    publish_embeddings([embedding.id], path["embedding"])
     return True
 
 
-def arrived(profile) -> None:
-    if isinstance(profile, bytes):
-        temp_image_path = save_temp_file(profile)
-    else:
-        temp_image_path = profile
+def show_info(message: str) -> None:
+    """
+    Default notification of the check-ins: a dialog. Only on the Tk (main) thread, a check-in made
+    on another thread notifies through `tk_notifier` or `log_info` instead.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        raise RuntimeError("Dialogs can only be shown on the Tk thread, notify with tk_notifier or log_info.")
+    messagebox.showinfo("Info", message)
 
-    result = compare_face(temp_image_path)
-    if isinstance(profile, bytes):
-        os.remove(temp_image_path)
+
+def log_info(message: str) -> None:
+    """
+    Notification of the check-ins made without a UI (the API, the gate cameras): logged and printed.
+    """
+    logging.info(message)
+    print(message)
+
+
+def tk_notifier(root) -> Callable[[str], None]:
+    """
+    Notification for the check-ins made off the Tk thread (e.g. by a capture pipeline stage):
+    the dialog is posted to the main loop of `root` instead of being shown by the calling thread.
+    :param root: Any widget of the Tk application.
+    """
+    return lambda message: root.after(0, show_info, message)
+
+
+def arrived(profile, notify: Callable[[str], None] = show_info) -> str | None:
+    """
+    Register the arrival of the operator in the profile picture.
+    :param profile: Path to the picture, its bytes, the decoded image or a `FaceCrop` detected by the camera.
+    :param notify: Called with the message for the user, `tk_notifier(root)` when not on the Tk thread.
+    :return: The recognized operator id, None if the face was not recognized.
+    """
+    try:
+        result = compare_face(profile)
+    except LowQualityFace as e:
+        notify(str(e))
+        return None
 
     if result[0]:
         operator_id = result[1]["operator_id"]
-        today_start = datetime.combine(date.today(), datetime.min.time())
-        existing_arrival = session.query(Arrival).filter(
-            Arrival.operator_id == operator_id,
-            Arrival.datestamp >= today_start
-        ).first()
-
-        if existing_arrival:
-            messagebox.showinfo("Info", f"Operator {operator_id} has already registered an arrival today.")
-            return
-
-        arrival = Arrival(operator_id=operator_id, datestamp=datetime.now())
-        session.add(arrival)
-        session.commit()
-        messagebox.showinfo("Info", f"The operator {operator_id} arrived at {arrival.datestamp}")
-    else:
-        messagebox.showinfo("Info", "Face not recognized. Who are you?")
+        # Checked against the arrivals seen today and stored by the write-behind queue, no query nor commit here
+        datestamp = get_attendance_queue().record("arrival", operator_id)
 
+        if datestamp is None:
+            notify(f"Operator {operator_id} has already registered an arrival today.")
+            return operator_id
 
-def departed(profile) -> None:
-    if isinstance(profile, bytes):
-        temp_image_path = save_temp_file(profile)
-    else:
-        temp_image_path = profile
+        notify(f"The operator {operator_id} arrived at {datestamp}")
+        return operator_id
+    notify("Face not recognized. Who are you?")
+    return None
 
-    result = compare_face(temp_image_path)
-    if isinstance(profile, bytes):
-        os.remove(temp_image_path)
+
+def departed(profile, notify: Callable[[str], None] = show_info) -> str | None:
+    """
+    Register the departure of the operator in the profile picture.
+    :param profile: Path to the picture, its bytes, the decoded image or a `FaceCrop` detected by the camera.
+    :param notify: Called with the message for the user, `tk_notifier(root)` when not on the Tk thread.
+    :return: The recognized operator id, None if the face was not recognized.
+    """
+    try:
+        result = compare_face(profile)
+    except LowQualityFace as e:
+        notify(str(e))
+        return None
 
     if result[0]:
         operator_id = result[1]["operator_id"]
-        today_start = datetime.combine(date.today(), datetime.min.time())
-        existing_departure = session.query(Departure).filter(
-            Departure.operator_id == operator_id,
-            Departure.datestamp >= today_start
-        ).first()
-
-        if existing_departure:
-            messagebox.showinfo("Info", f"Operator {operator_id} has already registered a departure today.")
-            return
-
-        departure = Departure(operator_id=operator_id, datestamp=datetime.now())
-        session.add(departure)
-        session.commit()
-        messagebox.showinfo("Info", f"The operator {operator_id} departed at {departure.datestamp}")
-    else:
-        messagebox.showinfo("Info", "Face not recognized. Who are you?")
+        # Checked against the departures seen today and stored by the write-behind queue, no query nor commit here
+        datestamp = get_attendance_queue().record("departure", operator_id)
+
+        if datestamp is None:
+            notify(f"Operator {operator_id} has already registered a departure today.")
+            return operator_id
+
+        notify(f"The operator {operator_id} departed at {datestamp}")
+        return operator_id
+    notify("Face not recognized. Who are you?")
+    return None
+
 
+def _register_many(kind: str, profiles: list, action: str, notify: Callable[[str], None]) -> list[str | None]:
+    """
+    Recognize every face of a group and queue an event of type `kind` for each operator,
+    as one group stored in a single transaction. Operators who already have one today
+    are not registered twice.
+    :param notify: Called with one message summing up the group.
+    :return: The recognized operator id of each face, None for the faces not recognized.
+    """
+    operator_ids = [details["operator_id"] if found else None for found, details in compare_faces(profiles)]
+    recognized = list(dict.fromkeys(operator_id for operator_id in operator_ids if operator_id is not None))
+    if not recognized:
+        notify("Faces not recognized. Who are you?")
+        return operator_ids
+
+    datestamps = dict(zip(recognized, get_attendance_queue().record_many(kind, recognized)))
+
+    lines = [f"The operator {operator_id} {action} at {datestamps[operator_id]}" for operator_id in recognized
+             if datestamps[operator_id] is not None]
+    lines += [f"Operator {operator_id} has already been registered today." for operator_id in recognized
+              if datestamps[operator_id] is None]
+    if None in operator_ids:
+        lines.append(f"{operator_ids.count(None)} face(s) not recognized.")
+    notify("\n".join(lines))
+    return operator_ids
+
+
+def arrived_many(profiles: list, notify: Callable[[str], None] = show_info) -> list[str | None]:
+    """
+    Register the arrival of everyone in a group (e.g. every face of a frame at shift change):
+    the faces are embedded in one batch and the arrivals stored in one transaction.
+    :param profiles: `FaceCrop`s detected by the camera, or decoded images.
+    :param notify: Called with the message for the user, `tk_notifier(root)` when not on the Tk thread
+                   (e.g. as the group recognizer of `cam.detect.FaceCapture`).
+    :return: The recognized operator id of each face, None for the faces not recognized.
+    """
+    return _register_many("arrival", profiles, "arrived", notify)
 
+
+def departed_many(profiles: list, notify: Callable[[str], None] = show_info) -> list[str | None]:
+    """
+    Register the departure of everyone in a group, like `arrived_many`.
+    :param profiles: `FaceCrop`s detected by the camera, or decoded images.
+    :param notify: Called with the message for the user, `tk_notifier(root)` when not on the Tk thread.
+    :return: The recognized operator id of each face, None for the faces not recognized.
+    """
+    return _register_many("departure", profiles, "departed", notify)
+
+
+@read_only
 def assiduity(operator_id: str) -> dict:
-    all_arrivals = session.query(Arrival).filter_by(operator_id=operator_id).all()
-    all_departures = session.query(Departure).filter_by(operator_id=operator_id).all()
+    all_arrivals = read_session.query(Arrival).filter_by(operator_id=operator_id).all()
+    all_departures = read_session.query(Departure).filter_by(operator_id=operator_id).all()
     return {
         "arrivals": [arrival.to_dict() for arrival in all_arrivals],
         "departures": [departure.to_dict() for departure in all_departures],
     }
 
 
+@read_only
 def everyone() -> list:
-    operators = session.query(Operator).all()
-    profiles = session.query(Profile).all()
+    operators = read_session.query(Operator).all()
+    profiles = read_session.query(Profile).all()
     profile_map = {profile.operator_id: profile.to_dict() for profile in profiles}
     return [{"operator": op.to_dict(), "profile": profile_map.get(op.id)} for op in operators]
 
 
+@read_only
 def someone(operator_id: str) -> dict:
-    operator = session.query(Operator).filter_by(id=operator_id).first()
+    operator = read_session.query(Operator).filter_by(id=operator_id).first()
     if not operator:
         raise ValueError(f"No operator found with ID {operator_id}")
-    profile = session.query(Profile).filter_by(operator_id=operator_id).first()
+    profile = read_session.query(Profile).filter_by(operator_id=operator_id).first()
     return {"operator": operator.to_dict(), "profile": profile.to_dict() if profile else None}
 
 
+@read_only
 def arrivals(operator_id: str, interval: int = 7) -> dict:
-    operator = session.query(Operator).filter_by(id=operator_id).first()
+    operator = read_session.query(Operator).filter_by(id=operator_id).first()
     if not operator:
         raise ValueError(f"No operator found with ID {operator_id}")
     time_threshold = datetime.now() - timedelta(days=interval)
-    all_arrivals = session.query(Arrival).filter(
+    all_arrivals = read_session.query(Arrival).filter(
         Arrival.operator_id == operator_id, Arrival.datestamp > time_threshold).all()
     return {"operator": operator.to_dict(), "arrivals": [arrival.to_dict() for arrival in all_arrivals]}
 
 
+@read_only
 def departures(operator_id: str, interval: int = 7) -> dict:
-    operator = session.query(Operator).filter_by(id=operator_id).first()
+    operator = read_session.query(Operator).filter_by(id=operator_id).first()
     if not operator:
         raise ValueError(f"No operator found with ID {operator_id}")
     time_threshold = datetime.now() - timedelta(days=interval)
-    all_departures = session.query(Departure).filter(
+    all_departures = read_session.query(Departure).filter(
         Departure.operator_id == operator_id, Departure.datestamp > time_threshold).all()
     return {"operator": operator.to_dict(), "departures": [dep.to_dict() for dep in all_departures]}
+
+
+def _period(start: date | None, end: date | None) -> tuple[date, date]:
+    """The days of a report: up to today and from the first of the month by default."""
+    end = end or date.today()
+    start = start or end.replace(day=1)
+    if start > end:
+        raise ValueError(f"The period starts ({start}) after it ends ({end})")
+    return start, end
+
+
+@read_only
+def attendance(operator_id: str, start: date | None = None, end: date | None = None) -> dict:
+    """
+    The daily attendance of an operator over a period, read from the rollup.
+    :return: The operator, one row per day with an arrival or a departure, and the totals.
+    """
+    operator = read_session.query(Operator).filter_by(id=operator_id).first()
+    if not operator:
+        raise ValueError(f"No operator found with ID {operator_id}")
+    start, end = _period(start, end)
+    days = read_session.query(AttendanceDaily).filter(
+        AttendanceDaily.operator_id == operator_id,
+        AttendanceDaily.day >= start, AttendanceDaily.day <= end
+    ).order_by(AttendanceDaily.day).all()
+    return {
+        "operator": operator.to_dict(),
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "days": [day.to_dict() for day in days],
+        "days_arrived": sum(day.first_arrival is not None for day in days),
+        "worked_seconds": sum(day.worked_seconds for day in days),
+    }
+
+
+@read_only
+def attendance_report(start: date | None = None, end: date | None = None) -> dict:
+    """
+    The attendance of every operator over a period, summed in the database from the rollup.
+    :return: Per operator: the days with an event, the days arrived, the days flagged
+             (see `rollup.py`) and the time worked.
+    """
+    start, end = _period(start, end)
+    in_period = and_(AttendanceDaily.operator_id == Operator.id,
+                     AttendanceDaily.day >= start, AttendanceDaily.day <= end)
+    rows = read_session.query(
+        Operator.id,
+        Operator.name,
+        func.count(AttendanceDaily.day),
+        func.count(AttendanceDaily.first_arrival),
+        func.sum(case((AttendanceDaily.flags != 0, 1), else_=0)),
+        func.coalesce(func.sum(AttendanceDaily.worked_seconds), 0),
+    ).outerjoin(AttendanceDaily, in_period).group_by(Operator.id, Operator.name).order_by(Operator.name)
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "operators": [
+            {"operator_id": operator_id, "name": name, "days": days, "days_arrived": days_arrived,
+             "days_flagged": days_flagged or 0, "worked_seconds": worked_seconds}
+            for operator_id, name, days, days_arrived, days_flagged, worked_seconds in rows
+        ],
+    }
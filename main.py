@@ -1,9 +1,13 @@
 import customtkinter as ctk
+from functools import partial
 from api import app  # Ensure this is your Flask application
 from cam.detect import FaceCapture
 from cam.interface import CaptureInterface
+from functions import arrived_many, departed_many, tk_notifier
 import multiprocessing
 
+from recognition.service import start_service
+from recognition.embedding import start_warm_up
 from ui.management import ManagementBoard
 from unarrived import Unarrived
 
@@ -37,20 +41,33 @@ def launch_signal(frame: ctk.CTkFrame, app_instance):
     CaptureInterface(frame)
 
 
-def launch_scan(frame: ctk.CTkFrame, app_instance):
-    """Starts face scanning."""
+def launch_scan(frame: ctk.CTkFrame, app_instance, arrive: bool = True):
+    """
+    Starts face scanning: the faces seen together are recognized in one batch and
+    registered as arrivals (or departures) in one transaction.
+    """
     if app_instance.face_capture:
         app_instance.face_capture.stop()
         app_instance.face_capture = None
     for widget in frame.winfo_children():
         widget.destroy()
 
-    app_instance.face_capture = FaceCapture(frame)
+    mode = ctk.CTkSegmentedButton(
+        frame, values=["Arrivals", "Departures"],
+        command=lambda value: launch_scan(frame, app_instance, arrive=value == "Arrivals")
+    )
+    mode.set("Arrivals" if arrive else "Departures")
+    mode.pack(pady=10)
+
+    # The recognizer runs on a capture pipeline thread, its dialogs are posted to the Tk main loop
+    register = arrived_many if arrive else departed_many
+    app_instance.face_capture = FaceCapture(frame, group_recognizer=partial(register, notify=tk_notifier(frame)))
     app_instance.face_capture.start()
 
 
 def run_flask(ip, port):
     """Run the Flask application."""
+    start_service()
     app.run(host=ip, port=port, debug=False, use_reloader=False)
 
 
@@ -72,6 +89,10 @@ class App(ctk.CTk):
 
         self.face_capture = None
         self.api_process = None
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # Load the model while the user navigates, so the first check-in does not wait for it
+        start_warm_up()
 
     def create_navbar(self):
         """Create a sidebar navigation panel."""
@@ -176,7 +197,8 @@ class App(ctk.CTk):
         ip = self.ip_entry.get() or "0.0.0.0"
         port = int(self.port_entry.get() or 5000)
 
-        self.api_process = multiprocessing.Process(target=run_flask, args=(ip, port), daemon=True)
+        # Not a daemon: the API process starts its own inference worker processes
+        self.api_process = multiprocessing.Process(target=run_flask, args=(ip, port))
         self.api_process.start()
 
         self.api_control_button.configure(text="Stop API")
@@ -189,6 +211,13 @@ class App(ctk.CTk):
 
         self.api_control_button.configure(text="Start API")
 
+    def on_close(self):
+        """Stop the API process before closing the window."""
+        if self.api_process and self.api_process.is_alive():
+            self.api_process.terminate()
+            self.api_process.join()
+        self.destroy()
+
 
 if __name__ == "__main__":
     app = App()
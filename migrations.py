@@ -0,0 +1,175 @@
+"""
+Versioned schema migrations of the SQLite database.
+The schema version is kept in `PRAGMA user_version`: each migration runs once, in order,
+in its own transaction, and bumps the version. A copy of the database is kept before upgrading.
+
+Run directly to upgrade a database in place:
+
+    python migrations.py [frs.sqlite]
+"""
+
+import os
+import sys
+import sqlite3
+import logging
+
+
+def _table_exists(connection: sqlite3.Connection, table: str) -> bool:
+    return connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone() is not None
+
+
+def _column_type(connection: sqlite3.Connection, table: str, column: str) -> str | None:
+    for _, name, column_type, *_ in connection.execute(f"PRAGMA table_info({table})"):
+        if name == column:
+            return column_type.upper()
+    return None
+
+
+def _rebuild_attendance_table(connection: sqlite3.Connection, table: str) -> None:
+    """
+    SQLite cannot change a column type: rebuild the table with operator_id as a string
+    (operator ids are UUIDs) and copy the rows over, ids included.
+    """
+    if not _table_exists(connection, table):
+        return  # Created with the current schema by `create_all`
+    if _column_type(connection, table, "operator_id") != "VARCHAR":
+        connection.execute(f"""
+            CREATE TABLE {table}_new (
+                id INTEGER NOT NULL,
+                operator_id VARCHAR,
+                datestamp DATETIME,
+                PRIMARY KEY (id),
+                FOREIGN KEY(operator_id) REFERENCES operators (id)
+            )
+        """)
+        connection.execute(f"""
+            INSERT INTO {table}_new (id, operator_id, datestamp)
+            SELECT id, CAST(operator_id AS TEXT), datestamp FROM {table}
+        """)
+        connection.execute(f"DROP TABLE {table}")
+        connection.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+
+def _index_attendance_table(connection: sqlite3.Connection, table: str) -> None:
+    """Add the indexes declared on the model (see `models.Arrival`)."""
+    if not _table_exists(connection, table):
+        return
+    connection.execute(
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_operator_id_datestamp ON {table} (operator_id, datestamp)"
+    )
+    connection.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_datestamp ON {table} (datestamp)")
+
+
+def migration_1(connection: sqlite3.Connection) -> None:
+    """Attendance operator_id as VARCHAR, with (operator_id, datestamp) and (datestamp) indexes."""
+    for table in ("arrivals", "departures"):
+        _rebuild_attendance_table(connection, table)
+        _index_attendance_table(connection, table)
+
+
+def migration_2(connection: sqlite3.Connection) -> None:
+    """Daily attendance rollup table, filled from the existing arrivals and departures."""
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS attendance_daily (
+            operator_id VARCHAR NOT NULL,
+            day DATE NOT NULL,
+            first_arrival DATETIME,
+            last_departure DATETIME,
+            worked_seconds INTEGER NOT NULL,
+            flags INTEGER NOT NULL,
+            PRIMARY KEY (operator_id, day),
+            FOREIGN KEY(operator_id) REFERENCES operators (id)
+        )
+    """)
+    connection.execute("CREATE INDEX IF NOT EXISTS ix_attendance_daily_day ON attendance_daily (day)")
+    if not (_table_exists(connection, "arrivals") and _table_exists(connection, "departures")):
+        return  # No history to roll up
+    # Frozen copy of what `rollup.backfill` computes, flags included (1: no arrival,
+    # 2: no departure, 4: departed before arriving)
+    connection.execute("""
+        WITH merged AS (
+            SELECT operator_id, day, min(arrival) AS first_arrival, max(departure) AS last_departure
+            FROM (
+                SELECT operator_id, date(datestamp) AS day, datestamp AS arrival, NULL AS departure FROM arrivals
+                UNION ALL
+                SELECT operator_id, date(datestamp) AS day, NULL AS arrival, datestamp AS departure FROM departures
+            )
+            GROUP BY operator_id, day
+        )
+        INSERT OR REPLACE INTO attendance_daily
+            (operator_id, day, first_arrival, last_departure, worked_seconds, flags)
+        SELECT operator_id, day, first_arrival, last_departure,
+            CASE WHEN last_departure > first_arrival
+                THEN CAST(round((julianday(last_departure) - julianday(first_arrival)) * 86400) AS INTEGER)
+                ELSE 0 END,
+            (CASE WHEN first_arrival IS NULL THEN 1 ELSE 0 END)
+            + (CASE WHEN last_departure IS NULL THEN 2 ELSE 0 END)
+            + (CASE WHEN last_departure <= first_arrival THEN 4 ELSE 0 END)
+        FROM merged
+    """)
+
+
+# Every migration, in order: migration N brings the database to version N.
+# Migrations must work on a database where `create_all` did not create their tables yet.
+MIGRATIONS = [
+    migration_1,
+    migration_2,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_version(connection: sqlite3.Connection) -> int:
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(path: str, backup: bool = True) -> int:
+    """
+    Bring a database up to SCHEMA_VERSION, in place.
+    :param path: Path to the SQLite file (created if missing).
+    :param backup: Copy the database to `<path>.v<version>.bak` before upgrading it.
+    :return: The number of migrations applied.
+    """
+    # Autocommit mode, the transactions are explicit so that DDL is transactional too
+    connection = sqlite3.connect(path, isolation_level=None, timeout=30)
+    try:
+        version = get_version(connection)
+        pending = MIGRATIONS[version:]
+        if not pending:
+            return 0
+
+        if backup and _table_exists(connection, "operators"):
+            backup_path = f"{path}.v{version}.bak"
+            with sqlite3.connect(backup_path) as copy:
+                connection.backup(copy)
+            copy.close()
+            logging.info(f"Database copied to {backup_path} before migrating.")
+
+        for number, migration in enumerate(pending, start=version + 1):
+            connection.execute("BEGIN IMMEDIATE")
+            if get_version(connection) >= number:
+                connection.execute("COMMIT")  # Applied by another process (e.g. the API) meanwhile
+                continue
+            try:
+                migration(connection)
+                connection.execute(f"PRAGMA user_version = {number}")
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            logging.info(f"Database migrated to version {number}: {migration.__doc__}")
+        return len(pending)
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    database_path = sys.argv[1] if len(sys.argv) > 1 else "frs.sqlite"
+    if not os.path.exists(database_path):
+        print(f"No database at {database_path}.")
+        sys.exit(1)
+    applied = migrate(database_path)
+    print(f"{database_path} is at schema version {SCHEMA_VERSION} ({applied} migration(s) applied).")
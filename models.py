@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Boolean, LargeBinary, Index
 from sqlalchemy.ext.declarative import declarative_base
 
 # Create the Base class
@@ -51,20 +51,65 @@ class Profile(Base, BaseMixin):
     profile_path = Column(String)
     processed = Column(Boolean)
 
+# FaceEmbedding's model
+# The embedding "vector" of size "dimension" computed once at enrollment for the profile
+# image "profile_path" of the operator "operator_id", by the model "model_name" at "model_version".
+class FaceEmbedding(Base, BaseMixin):
+    __tablename__ = 'face_embeddings'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    operator_id = Column(String, ForeignKey('operators.id'))
+    profile_path = Column(String)
+    model_name = Column(String)
+    model_version = Column(String)
+    dimension = Column(Integer)
+    vector = Column(LargeBinary)
+    created_at = Column(DateTime)
+
 # Arrival's model
 # The arrival model defined by the operator "operator_id" who arrived at "datestamp".
 class Arrival(Base, BaseMixin):
     __tablename__ = 'arrivals'
+    __table_args__ = (
+        # "Has the operator arrived today?" and per operator histories
+        Index('ix_arrivals_operator_id_datestamp', 'operator_id', 'datestamp'),
+        # Everyone who arrived in a period
+        Index('ix_arrivals_datestamp', 'datestamp'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    operator_id = Column(Integer, ForeignKey('operators.id'))
+    operator_id = Column(String, ForeignKey('operators.id'))
     datestamp = Column(DateTime)
 
 # Departure's model
 # The departure model defined by the operator "operator_id" who departed at "datestamp".
 class Departure(Base, BaseMixin):
     __tablename__ = 'departures'
+    __table_args__ = (
+        # "Has the operator departed today?" and per operator histories
+        Index('ix_departures_operator_id_datestamp', 'operator_id', 'datestamp'),
+        # Everyone who departed in a period
+        Index('ix_departures_datestamp', 'datestamp'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    operator_id = Column(Integer, ForeignKey('operators.id'))
+    operator_id = Column(String, ForeignKey('operators.id'))
     datestamp = Column(DateTime)
+
+# AttendanceDaily's model
+# The attendance of the operator "operator_id" on "day": first arrival "first_arrival", last departure
+# "last_departure", the "worked_seconds" between them and the anomaly "flags" (see `rollup.py`).
+# Derived from the arrivals and departures, kept up to date as they are stored.
+class AttendanceDaily(Base, BaseMixin):
+    __tablename__ = 'attendance_daily'
+    __table_args__ = (
+        # Everyone's attendance over a period (the per operator ranges use the primary key)
+        Index('ix_attendance_daily_day', 'day'),
+    )
+
+    operator_id = Column(String, ForeignKey('operators.id'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    first_arrival = Column(DateTime)
+    last_departure = Column(DateTime)
+    worked_seconds = Column(Integer, nullable=False, default=0)
+    flags = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,202 @@
+"""
+In-memory presence index of the day: who arrived and who departed today.
+Every operator gets a dense index into two bitmaps (arrivals and departures), so the
+duplicate checks, the list of the operators not arrived yet and the daily counts
+are memory operations instead of queries.
+The index is rebuilt from the database when the day changes and updated on every event.
+"""
+
+import time
+import threading
+from datetime import datetime, date
+
+import numpy as np
+
+from models import Arrival, Departure, Operator
+from database import read_session, read_only
+
+# Bitmap slots allocated up front, doubled whenever the operators outgrow them
+PRESENCE_CAPACITY = 1024
+
+# Re-read today's events (and the operators) at most this often, in seconds, so that the events
+# recorded by other processes (the API and the capture app) show up. None never re-reads.
+# Meanwhile the index is only a fast path: the events another process already stored are
+# skipped when committed (see `attendance._store`).
+PRESENCE_RESYNC_SECONDS = 60
+
+EVENT_KINDS = ("arrival", "departure")
+
+_EVENT_MODELS = {"arrival": Arrival, "departure": Departure}
+
+
+class PresenceIndex:
+    """
+    Arrival and departure bitmaps of one day, indexed by a dense operator index.
+    Thread-safe; an unknown operator gets an index on first use.
+    """
+
+    def __init__(self, capacity: int = PRESENCE_CAPACITY, resync_seconds: float | None = PRESENCE_RESYNC_SECONDS):
+        """
+        :param capacity: Initial number of operator slots.
+        :param resync_seconds: Maximum age of the index before today's events are re-read, None to never re-read.
+        """
+        self.resync_seconds = resync_seconds
+        self.lock = threading.Lock()
+        self.operators = []  # Dense index -> operator id
+        self.index = {}  # Operator id -> dense index
+        self.bitmaps = {kind: np.zeros(capacity, dtype=bool) for kind in EVENT_KINDS}
+        self.day = None
+        self.synced_at = 0.0
+        self.rebuilds = 0
+
+    @staticmethod
+    @read_only
+    def _load(day: date) -> tuple[list[str], dict[str, list[str]]]:
+        """
+        Read the operators and the events of a day, outside of the lock.
+        :return: Every operator id, and the ids of the operators with an event of each kind that day.
+        """
+        day_start = datetime.combine(day, datetime.min.time())
+        day_end = datetime.combine(day, datetime.max.time())
+        operator_ids = [operator_id for (operator_id,) in read_session.query(Operator.id).order_by(Operator.id)]
+        events = {
+            kind: [operator_id for (operator_id,) in read_session.query(model.operator_id).filter(
+                model.datestamp >= day_start, model.datestamp <= day_end
+            ).distinct()]
+            for kind, model in _EVENT_MODELS.items()
+        }
+        return operator_ids, events
+
+    def _slot(self, operator_id: str) -> int:
+        """Dense index of an operator, allocated (and the bitmaps grown) if needed. Lock held."""
+        slot = self.index.get(operator_id)
+        if slot is None:
+            slot = len(self.operators)
+            self.operators.append(operator_id)
+            self.index[operator_id] = slot
+            capacity = len(self.bitmaps["arrival"])
+            if slot >= capacity:
+                for kind, bitmap in self.bitmaps.items():
+                    grown = np.zeros(capacity * 2, dtype=bool)
+                    grown[:capacity] = bitmap
+                    self.bitmaps[kind] = grown
+        return slot
+
+    def _merge(self, day: date, operator_ids: list[str], events: dict[str, list[str]]) -> None:
+        """
+        Apply what `_load` read. Lock held.
+        On a new day the bitmaps start empty; on the same day the bits are only ever added, so
+        the events queued here and not committed yet are kept.
+        """
+        if self.day != day:
+            self.day = day
+            for bitmap in self.bitmaps.values():
+                bitmap[:] = False
+            self.rebuilds += 1
+        for operator_id in operator_ids:
+            self._slot(operator_id)
+        for kind, event_ids in events.items():
+            for operator_id in event_ids:
+                slot = self._slot(operator_id)
+                self.bitmaps[kind][slot] = True
+        self.synced_at = time.monotonic()
+
+    def sync(self, day: date | None = None, force: bool = False) -> None:
+        """
+        Bring the index to `day` (today by default): rebuilt on a day change, refreshed
+        from the database when older than `resync_seconds`, left alone otherwise.
+        """
+        day = day or date.today()
+        with self.lock:
+            stale = self.resync_seconds is not None and time.monotonic() - self.synced_at > self.resync_seconds
+            if self.day == day and not stale and not force:
+                return
+        operator_ids, events = self._load(day)
+        with self.lock:
+            if self.day is not None and self.day > day:
+                return  # Another thread moved on to a later day meanwhile
+            self._merge(day, operator_ids, events)
+
+    def mark(self, kind: str, operator_id: str, day: date | None = None) -> bool:
+        """
+        Set the event of an operator for the day.
+        :param kind: "arrival" or "departure".
+        :param day: The day of the event, today by default.
+        :return: True if it was not set yet, False for a duplicate.
+        """
+        if kind not in self.bitmaps:
+            raise ValueError(f"Unknown attendance event: {kind}")
+        day = day or date.today()
+        self.sync(day)
+        with self.lock:
+            if self.day != day:
+                return True  # An event of a past day: nothing to check it against
+            slot = self._slot(operator_id)  # Before taking the bitmap, it may grow
+            bitmap = self.bitmaps[kind]
+            if bitmap[slot]:
+                return False
+            bitmap[slot] = True
+            return True
+
+    def has(self, kind: str, operator_id: str) -> bool:
+        """Whether the operator already has an event of this kind today."""
+        self.sync()
+        with self.lock:
+            slot = self.index.get(operator_id)
+            return slot is not None and bool(self.bitmaps[kind][slot])
+
+    def add_operator(self, operator_id: str) -> None:
+        """Give a newly registered operator a slot, so the counts include them right away."""
+        with self.lock:
+            self._slot(operator_id)
+
+    def unarrived(self) -> list[str]:
+        """
+        :return: The ids of the operators who have not arrived today.
+        """
+        self.sync()
+        with self.lock:
+            count = len(self.operators)
+            return [self.operators[slot] for slot in np.flatnonzero(~self.bitmaps["arrival"][:count])]
+
+    def counts(self) -> dict:
+        """
+        :return: The number of operators, and of those present (arrived, not departed),
+                 absent (not arrived) and departed today.
+        """
+        self.sync()
+        with self.lock:
+            count = len(self.operators)
+            arrived = self.bitmaps["arrival"][:count]
+            departed = self.bitmaps["departure"][:count]
+            return {
+                "day": self.day.isoformat(),
+                "operators": count,
+                "present": int(np.count_nonzero(arrived & ~departed)),
+                "absent": int(count - np.count_nonzero(arrived)),
+                "departed": int(np.count_nonzero(departed)),
+            }
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "operators": len(self.operators),
+                "capacity": len(self.bitmaps["arrival"]),
+                "rebuilds": self.rebuilds,
+                "synced_seconds_ago": round(time.monotonic() - self.synced_at, 1),
+            }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_presence_index() -> PresenceIndex:
+    """
+    The presence index of this process, built on first use.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = PresenceIndex()
+        return _index
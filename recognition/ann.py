@@ -0,0 +1,237 @@
+import os
+import logging
+import threading
+
+import numpy as np
+
+# Where the index is persisted between runs
+ANN_INDEX_PATH = "./faces/ann_index.npz"
+
+# Galleries smaller than this are scanned exactly, the index only pays off on large galleries
+ANN_MIN_SIZE = 20000
+
+# Number of inverted lists probed per query (higher is slower but closer to the exact scan)
+ANN_PROBES = 16
+
+
+class IVFFlatIndex:
+    """
+    Inverted-file index over normalized embeddings.
+    Vectors are bucketed by their closest k-means centroid and a query only scans the
+    buckets of its `n_probe` closest centroids. Vectors are stored uncompressed ("flat"),
+    so the similarities returned are exact for the rows that are scanned.
+    """
+
+    def __init__(self, centroids: np.ndarray, n_probe: int = ANN_PROBES):
+        """
+        :param centroids: The trained centroids, shape (lists, dimension).
+        :param n_probe: Number of lists scanned per query.
+        """
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.n_probe = n_probe
+        self.list_keys = [np.empty(0, dtype=np.int64) for _ in range(len(self.centroids))]
+        self.list_vectors = [np.empty((0, self.dimension), dtype=np.float32) for _ in range(len(self.centroids))]
+        self.key_list = {}
+
+    @property
+    def dimension(self) -> int:
+        return self.centroids.shape[1]
+
+    def __len__(self):
+        return len(self.key_list)
+
+    def __contains__(self, key):
+        return int(key) in self.key_list
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, n_lists: int | None = None, iterations: int = 10,
+              sample_size: int = 20000, seed: int = 0, **kwargs) -> "IVFFlatIndex":
+        """
+        Train the centroids with spherical k-means on a sample of the vectors.
+        :param vectors: Normalized embeddings, shape (rows, dimension).
+        :param n_lists: Number of inverted lists (defaults to the square root of the row count).
+        :param iterations: Number of k-means iterations.
+        :param sample_size: Maximum number of vectors used for training.
+        :param seed: Seed of the sampling and initialization, so training is reproducible.
+        :return: An empty index with trained centroids.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        rng = np.random.default_rng(seed)
+        n_lists = n_lists or max(1, int(np.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+
+        sample = vectors
+        if len(vectors) > sample_size:
+            sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignment = _nearest(sample, centroids)
+            for list_id in range(n_lists):
+                members = sample[assignment == list_id]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    norm = np.linalg.norm(centroid)
+                    centroids[list_id] = centroid / norm if norm > 0 else centroid
+                else:
+                    # Reseed empty lists so every centroid keeps a share of the data
+                    centroids[list_id] = sample[rng.integers(len(sample))]
+
+        return cls(centroids, **kwargs)
+
+    def add(self, keys, vectors: np.ndarray) -> None:
+        """
+        Insert vectors, replacing any vector already stored under the same key.
+        :param keys: Integer keys of the vectors (the face_embeddings ids).
+        :param vectors: Normalized embeddings, shape (rows, dimension).
+        """
+        keys = np.atleast_1d(np.asarray(keys, dtype=np.int64))
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(keys), self.dimension)
+        self.remove([key for key in keys if key in self])
+
+        assignment = _nearest(vectors, self.centroids)
+        for list_id in np.unique(assignment):
+            members = assignment == list_id
+            self.list_keys[list_id] = np.concatenate([self.list_keys[list_id], keys[members]])
+            self.list_vectors[list_id] = np.vstack([self.list_vectors[list_id], vectors[members]])
+            for key in keys[members]:
+                self.key_list[int(key)] = int(list_id)
+
+    def remove(self, keys) -> None:
+        """
+        Delete vectors by key, unknown keys are ignored.
+        """
+        by_list = {}
+        for key in np.atleast_1d(np.asarray(keys, dtype=np.int64)):
+            list_id = self.key_list.pop(int(key), None)
+            if list_id is not None:
+                by_list.setdefault(list_id, []).append(key)
+
+        for list_id, removed in by_list.items():
+            keep = ~np.isin(self.list_keys[list_id], removed)
+            self.list_keys[list_id] = self.list_keys[list_id][keep]
+            self.list_vectors[list_id] = self.list_vectors[list_id][keep]
+
+    def search(self, probe: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top-k search by cosine similarity.
+        :param probe: The normalized probe embedding.
+        :param k: Number of results.
+        :return: A tuple (keys, similarities), best first.
+        """
+        probe = np.asarray(probe, dtype=np.float32)
+        n_probe = min(self.n_probe, len(self.centroids))
+        lists = np.argpartition(-(self.centroids @ probe), n_probe - 1)[:n_probe]
+
+        keys = [self.list_keys[list_id] for list_id in lists]
+        similarities = [self.list_vectors[list_id] @ probe for list_id in lists]
+        keys = np.concatenate(keys)
+        similarities = np.concatenate(similarities)
+        if len(keys) == 0:
+            return keys, similarities
+
+        if k < len(keys):
+            top = np.argpartition(-similarities, k - 1)[:k]
+        else:
+            top = np.arange(len(keys))
+        top = top[np.lexsort((keys[top], -similarities[top]))]
+        return keys[top], similarities[top]
+
+    def save(self, path: str = ANN_INDEX_PATH) -> None:
+        """
+        Persist the index atomically, readers never see a partially written file.
+        """
+        sizes = np.array([len(keys) for keys in self.list_keys], dtype=np.int64)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as index_file:
+            np.savez(
+                index_file,
+                centroids=self.centroids,
+                sizes=sizes,
+                keys=np.concatenate(self.list_keys),
+                vectors=np.vstack(self.list_vectors),
+                n_probe=np.int64(self.n_probe)
+            )
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str = ANN_INDEX_PATH) -> "IVFFlatIndex":
+        """
+        Load an index saved with `save`.
+        """
+        with np.load(path) as data:
+            index = cls(data["centroids"], n_probe=int(data["n_probe"]))
+            offsets = np.concatenate([[0], np.cumsum(data["sizes"])])
+            keys, vectors = data["keys"], data["vectors"]
+
+        for list_id in range(len(index.centroids)):
+            start, end = offsets[list_id], offsets[list_id + 1]
+            index.list_keys[list_id] = keys[start:end]
+            index.list_vectors[list_id] = vectors[start:end]
+            for key in keys[start:end]:
+                index.key_list[int(key)] = list_id
+        return index
+
+    def sync(self, keys, vectors: np.ndarray) -> bool:
+        """
+        Make the index hold exactly the given vectors, touching only the differences.
+        :param keys: The key of every row, rows with a negative key are skipped.
+        :param vectors: The rows, only the missing ones are read.
+        :return: True if the index changed.
+        """
+        keys = np.asarray(keys, dtype=np.int64)
+        wanted = set(keys[keys >= 0].tolist())
+        stale = [key for key in self.key_list if key not in wanted]
+        missing = np.flatnonzero([key >= 0 and key not in self.key_list for key in keys.tolist()])
+
+        self.remove(stale)
+        if len(missing):
+            self.add(keys[missing], vectors[missing])
+        return bool(stale) or bool(len(missing))
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 4096) -> np.ndarray:
+    """
+    Index of the closest centroid of every vector, computed in chunks to bound memory.
+    """
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk):
+        assignment[start:start + chunk] = np.argmax(vectors[start:start + chunk] @ centroids.T, axis=1)
+    return assignment
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index(keys, matrix: np.ndarray) -> IVFFlatIndex | None:
+    """
+    Return the process-wide index for a gallery, or None if the gallery is small enough to scan.
+    The persisted index is loaded (or trained the first time) and synchronized with the gallery.
+    This is the only place the index changes: it always follows a gallery refresh.
+    :param keys: The key of every gallery row, negative for deleted rows.
+    :param matrix: The gallery embeddings.
+    """
+    global _index
+
+    keys = np.asarray(keys, dtype=np.int64)
+    if np.count_nonzero(keys >= 0) < ANN_MIN_SIZE:
+        return None
+
+    with _index_lock:
+        if _index is None and os.path.exists(ANN_INDEX_PATH):
+            try:
+                _index = IVFFlatIndex.load(ANN_INDEX_PATH)
+            except Exception as e:
+                logging.error(f"Error loading the ANN index, it will be retrained: {e}")
+        if _index is None or _index.dimension != matrix.shape[1]:
+            logging.info(f"Training the ANN index on {len(keys)} embeddings...")
+            # Train on a sample of the live rows so a large mapped gallery is never copied whole
+            live = np.flatnonzero(keys >= 0)
+            sample = np.sort(np.random.default_rng(0).choice(live, min(len(live), 20000), replace=False))
+            _index = IVFFlatIndex.train(matrix[sample], n_lists=max(1, int(np.sqrt(len(live)))))
+            _index.sync(keys, matrix)
+            _index.save(ANN_INDEX_PATH)
+        elif _index.sync(keys, matrix):
+            _index.save(ANN_INDEX_PATH)
+        return _index
@@ -0,0 +1,105 @@
+"""
+Recall-vs-latency benchmark of the ANN index against the exact gallery scan.
+Runs on synthetic embeddings (several noisy samples per identity), so it needs no camera or model:
+
+    python -m recognition.benchmark --size 200000 --dimension 4096 --probes 4 8 16 32
+"""
+
+import time
+import argparse
+
+import numpy as np
+
+from recognition.ann import IVFFlatIndex
+from recognition.gallery import Gallery
+
+
+def synthetic_gallery(size: int, dimension: int, samples_per_identity: int, noise: float, seed: int):
+    """
+    Build normalized embeddings clustered around random identity centers.
+    :return: A tuple (gallery, identity centers).
+    """
+    rng = np.random.default_rng(seed)
+    identities = max(1, size // samples_per_identity)
+    centers = rng.standard_normal((identities, dimension), dtype=np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+
+    labels = np.arange(size) % identities
+    matrix = centers[labels] + noise * rng.standard_normal((size, dimension), dtype=np.float32) / np.sqrt(dimension)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+
+    gallery = Gallery(list(range(size)), [f"{label}" for label in labels], [""] * size, matrix)
+    return gallery, centers
+
+
+def make_probes(centers: np.ndarray, count: int, noise: float, seed: int) -> np.ndarray:
+    """
+    Fresh noisy samples of random identities, as a camera would produce.
+    """
+    rng = np.random.default_rng(seed + 1)
+    dimension = centers.shape[1]
+    probes = centers[rng.integers(len(centers), size=count)]
+    probes = probes + noise * rng.standard_normal(probes.shape, dtype=np.float32) / np.sqrt(dimension)
+    return probes / np.linalg.norm(probes, axis=1, keepdims=True)
+
+
+def measure(gallery: Gallery, probes: np.ndarray, k: int) -> tuple[list[list[str]], np.ndarray]:
+    """
+    Run every probe through the gallery.
+    :return: A tuple (ranked operator ids per probe, latencies in milliseconds).
+    """
+    rankings, latencies = [], []
+    for probe in probes:
+        start = time.perf_counter()
+        result = gallery.search(probe, k=k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        rankings.append([match["operator_id"] for match in result["matches"]])
+    return rankings, np.array(latencies)
+
+
+def recall(exact: list[list[str]], approximate: list[list[str]], k: int) -> float:
+    """
+    Fraction of the exact top-k operators also returned in the approximate top-k.
+    """
+    exact = [ranking[:k] for ranking in exact]
+    found = sum(len(set(e) & set(a[:k])) for e, a in zip(exact, approximate))
+    total = sum(len(e) for e in exact)
+    return found / total if total else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=50000, help="Number of stored embeddings.")
+    parser.add_argument("--dimension", type=int, default=4096, help="Embedding size (4096 for VGG-Face).")
+    parser.add_argument("--samples", type=int, default=3, help="Stored images per identity.")
+    parser.add_argument("--noise", type=float, default=0.8, help="Spread of the samples around each identity.")
+    parser.add_argument("--queries", type=int, default=200, help="Number of probes.")
+    parser.add_argument("--k", type=int, default=5, help="Operators returned per probe.")
+    parser.add_argument("--lists", type=int, default=None, help="Inverted lists (default: sqrt(size)).")
+    parser.add_argument("--probes", type=int, nargs="+", default=[4, 8, 16, 32], help="Lists scanned per query.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    gallery, centers = synthetic_gallery(args.size, args.dimension, args.samples, args.noise, args.seed)
+    probes = make_probes(centers, args.queries, args.noise, args.seed)
+
+    exact, latencies = measure(gallery, probes, args.k)
+    print(f"{'matcher':<16}{'recall@1':>10}{'recall@' + str(args.k):>10}{'p50 ms':>10}{'p99 ms':>10}")
+    print(f"{'exact':<16}{1.0:>10.3f}{1.0:>10.3f}{np.percentile(latencies, 50):>10.2f}{np.percentile(latencies, 99):>10.2f}")
+
+    start = time.perf_counter()
+    index = IVFFlatIndex.train(gallery.matrix, n_lists=args.lists, seed=args.seed)
+    index.add(gallery.keys, gallery.matrix)
+    print(f"(index trained and filled in {time.perf_counter() - start:.1f} s, {len(index.centroids)} lists)")
+
+    gallery.index = index
+    for n_probe in args.probes:
+        index.n_probe = n_probe
+        approximate, latencies = measure(gallery, probes, args.k)
+        print(f"{'ivf probe=' + str(n_probe):<16}{recall(exact, approximate, 1):>10.3f}"
+              f"{recall(exact, approximate, args.k):>10.3f}"
+              f"{np.percentile(latencies, 50):>10.2f}{np.percentile(latencies, 99):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,56 +1,124 @@
-import os
-from deepface import DeepFace
-from concurrent.futures import ThreadPoolExecutor
 import logging
-from PIL import Image
+import threading
+import numpy as np
+from cam.detector import FaceDetector
+from cam.quality import score_faces, LowQualityFace, MIN_QUALITY
+from recognition.crop import FaceCrop
+from recognition.embedding import represent, represent_many, decode_image
+from recognition.gallery import get_gallery
+from recognition.service import get_service
+from recognition.store import backfill_embeddings, operators_missing_embeddings
 
 logging.basicConfig(level=logging.INFO)
 BASE_IMAGE_DIR = "./faces/"
 
-def validate_image_path(image_path):
-    if not isinstance(image_path, str):
-        raise ValueError("Image path must be a string.")
-    if not os.path.exists(image_path):
-        raise FileNotFoundError(f"Image file not found: {image_path}")
-    try:
-        with Image.open(image_path) as img:
-            img.verify()  # Verify that the file is a valid image
-    except Exception as e:
-        raise ValueError(f"Invalid image file: {image_path}. Error: {e}")
-
-def compare_face(new_image_path: str) -> tuple[bool, dict | None]:
-    """
-    Compare a new face image against all stored images for all operators.
-    :param new_image_path: Path to the new face image (must be a string).
-    :return: A tuple (True if a match else False, and details like the id and image path).
-    """
-    validate_image_path(new_image_path)  # Validate the input image path
-
-    def process_operator_folder(operator_folder):
-        operator_id = operator_folder.split("_")[-1]  # Extract operator ID
-        operator_dir = os.path.join(BASE_IMAGE_DIR, operator_folder)
-
-        if not os.path.isdir(operator_dir):
-            return False, None
-
-        for stored_image_name in os.listdir(operator_dir):
-            stored_image_path = os.path.join(operator_dir, stored_image_name)
-            try:
-                result = DeepFace.verify(new_image_path, stored_image_path, model_name="VGG-Face", enforce_detection=False)
-                if result['verified']:
-                    return True, {
-                        "operator_id": operator_id,
-                        "image_path": stored_image_path
-                    }
-            except Exception as e:
-                logging.error(f"Error comparing {new_image_path} with {stored_image_path}: {e}")
-        return False, None
-
-    with ThreadPoolExecutor() as executor:
-        results = list(executor.map(process_operator_folder, os.listdir(BASE_IMAGE_DIR)))
-
-    for is_match, match_details in results:
-        if is_match:
-            return True, match_details
+# Whether stored images without an embedding were already backfilled in this process
+_backfilled = False
+
+# One face detector per thread, only used to find the face to score in a probe that is not a crop yet
+_detectors = threading.local()
+
+def _ensure_backfilled() -> None:
+    """
+    Embed the images enrolled before embeddings were stored (or before a model upgrade), once per
+    process. Whether any is missing comes from the database, not from the gallery file: the first
+    enrollment after an upgrade creates that file while older images still have no embedding.
+    If the backfill fails, it is retried on the next search.
+    """
+    global _backfilled
+
+    if not _backfilled:
+        missing = operators_missing_embeddings()
+        if missing:
+            logging.info(f"{len(missing)} operator(s) without an embedding, backfilling their images.")
+            backfill_embeddings()
+        _backfilled = True
+
+def check_quality(image: np.ndarray | FaceCrop, min_quality: float = MIN_QUALITY) -> float | None:
+    """
+    Reject a probe whose face is too poor to be recognized, before it is embedded.
+    A `FaceCrop` is scored as a whole. In a decoded image, the largest face found by the camera's
+    detector is scored; an image where it finds none is left to the model's own detector.
+    :return: The quality score, None if no face was found to score.
+    :raise LowQualityFace: If the score is under `min_quality`.
+    """
+    if isinstance(image, FaceCrop):
+        height, width = image.image.shape[:2]
+        frame, boxes = image.image, [(0, 0, width, height)]
+    else:
+        if not hasattr(_detectors, "detector"):
+            _detectors.detector = FaceDetector()
+        faces = _detectors.detector.detect(image)
+        if len(faces) == 0:
+            return None
+        frame, boxes = image, [max(faces, key=lambda face: face[2] * face[3])]
+    score = float(score_faces(frame, boxes)[0])
+    if score < min_quality:
+        raise LowQualityFace(score, min_quality)
+    return score
+
+def search_face(new_image: str | bytes | np.ndarray | FaceCrop, k: int = 5) -> dict:
+    """
+    Rank the operators closest to a new face image.
+    :param new_image: Path to the new face image, its encoded bytes (e.g. an upload), the decoded BGR array
+                      or a `FaceCrop` already detected by the camera (embedded without detecting it again).
+    :param k: Number of operators to return.
+    :return: The threshold used and the top-k operators with their cosine and L2 distances.
+    :raise LowQualityFace: If the face is too poor to be recognized (see `check_quality`).
+    """
+    # Decoding validates the image, it is the only decode of the probe
+    image = new_image if isinstance(new_image, FaceCrop) else decode_image(new_image)
+    check_quality(image)
+    _ensure_backfilled()
+
+    # The probe is embedded by the inference service when one is running
+    service = get_service()
+    probe = service.embed(image) if service else represent(image)
+    return get_gallery().search(probe, k=k)
+
+def compare_face(new_image: str | bytes | np.ndarray | FaceCrop, k: int = 5) -> tuple[bool, dict | None]:
+    """
+    Compare a new face image against the stored embeddings of all operators.
+    Only the new image goes through the model, the stored images were embedded at enrollment.
+    :param new_image: Path to the new face image, its encoded bytes, the decoded BGR array or a `FaceCrop`.
+    :param k: Number of ranked candidates to include in the details.
+    :return: A tuple (True if a match else False, and details like the id, image path, distance,
+             the threshold used and the top-k candidates).
+    """
+    return _outcome(search_face(new_image, k=k))
+
+def _outcome(result: dict) -> tuple[bool, dict | None]:
+    """
+    Turn a search result into the (matched, details) tuple of `compare_face`.
+    """
+    matches = result["matches"]
+
+    if matches and matches[0]["verified"]:
+        return True, {**matches[0], "threshold": result["threshold"], "matches": matches}
 
     return False, None
+
+def search_faces(new_images: list[FaceCrop | np.ndarray], k: int = 5) -> list[dict]:
+    """
+    Rank the operators closest to each of several faces, e.g. everyone in a frame:
+    the faces share one batched forward pass and one matrix product against the gallery.
+    :param new_images: Face crops already detected by the camera, or decoded BGR images.
+    :param k: Number of operators to return per face.
+    :return: One result per face, as returned by `search_face`.
+    """
+    if not new_images:
+        return []
+    _ensure_backfilled()
+
+    service = get_service()
+    probes = service.embed_many(new_images) if service else represent_many(new_images)
+    return get_gallery().search_many(probes, k=k)
+
+def compare_faces(new_images: list[FaceCrop | np.ndarray], k: int = 5) -> list[tuple[bool, dict | None]]:
+    """
+    Compare several faces at once against the stored embeddings of all operators.
+    :param new_images: Face crops already detected by the camera, or decoded BGR images.
+    :param k: Number of ranked candidates to include in the details.
+    :return: One tuple per face, as returned by `compare_face`.
+    """
+    return [_outcome(result) for result in search_faces(new_images, k=k)]
@@ -0,0 +1,46 @@
+import cv2
+import numpy as np
+
+
+class FaceCrop:
+    """
+    A face already detected (and possibly aligned) by the caller, e.g. the camera pipeline.
+    Recognition embeds it as is, without running face detection again.
+    """
+
+    def __init__(self, image: np.ndarray, box: tuple | None = None, landmarks: dict | None = None,
+                 aligned: bool = False):
+        """
+        :param image: The BGR face crop, tight around the face like a detector box.
+        :param box: Optional (x, y, w, h) box of the face in the frame it was cropped from.
+        :param landmarks: Optional landmarks in crop coordinates, "left_eye" and "right_eye" are used to align.
+        :param aligned: Whether the crop is already aligned (eyes level).
+        """
+        if image is None or image.ndim != 3 or image.size == 0:
+            raise ValueError("A face crop must be a non-empty BGR image.")
+        self.image = image
+        self.box = tuple(int(value) for value in box) if box is not None else None
+        self.landmarks = landmarks or {}
+        self.aligned = aligned
+
+    def face(self) -> np.ndarray:
+        """
+        The crop in the format `detect_face` returns: aligned RGB, float values in [0, 1].
+        """
+        image = self.image
+        if not self.aligned and "left_eye" in self.landmarks and "right_eye" in self.landmarks:
+            image = align_eyes(image, self.landmarks["left_eye"], self.landmarks["right_eye"])
+        return image[:, :, ::-1].astype(np.float32) / 255.0
+
+
+def align_eyes(image: np.ndarray, left_eye, right_eye) -> np.ndarray:
+    """
+    Rotate a face crop around the middle of the eyes so they are level.
+    :param left_eye: (x, y) of the eye on the left of the image.
+    :param right_eye: (x, y) of the eye on the right of the image.
+    """
+    (left_x, left_y), (right_x, right_y) = left_eye, right_eye
+    angle = np.degrees(np.arctan2(right_y - left_y, right_x - left_x))
+    center = ((left_x + right_x) / 2, (left_y + right_y) / 2)
+    rotation = cv2.getRotationMatrix2D(center, angle, 1.0)
+    return cv2.warpAffine(image, rotation, (image.shape[1], image.shape[0]), borderMode=cv2.BORDER_REPLICATE)
@@ -0,0 +1,231 @@
+import os
+import logging
+import threading
+from importlib.metadata import version, PackageNotFoundError
+
+import cv2
+import numpy as np
+from recognition.scheduler import get_scheduler
+from recognition.crop import FaceCrop
+
+# DeepFace (and with it TensorFlow/Keras) is only imported on the first model call,
+# so screens and processes that never run recognition do not pay for it.
+
+# Model used for every stored and probe embedding
+MODEL_NAME = "VGG-Face"
+
+try:
+    MODEL_VERSION = version("deepface")
+except PackageNotFoundError:
+    MODEL_VERSION = "unknown"
+
+# Face detector used before alignment and embedding
+DETECTOR_BACKEND = "opencv"
+
+# Cosine distance under which two VGG-Face embeddings belong to the same person
+# (same value DeepFace.verify uses for this model and metric)
+DISTANCE_THRESHOLD = 0.68
+
+_model_lock = threading.Lock()
+_forward = None
+_input_size = None
+_ready = threading.Event()
+_warm_up_lock = threading.Lock()
+_warm_up_thread = None
+
+
+def _deepface():
+    from deepface import DeepFace
+    return DeepFace
+
+
+def _model():
+    """
+    Build the model once and trace its forward pass into a graph function taking batches of any size.
+    :return: A tuple (forward function, (height, width) of the model input).
+    """
+    global _forward, _input_size
+
+    with _model_lock:
+        if _forward is None:
+            import tensorflow as tf
+
+            get_scheduler()  # Configures TensorFlow before the model is built
+            model = _deepface().build_model(model_name=MODEL_NAME)
+            target_size = model.input_shape
+            _input_size = (target_size[1], target_size[0])
+            _forward = tf.function(
+                lambda batch: model.model(batch, training=False),
+                input_signature=[tf.TensorSpec([None, *_input_size, 3], tf.float32)]
+            )
+        return _forward, _input_size
+
+
+def normalize(vector: np.ndarray) -> np.ndarray:
+    """
+    Scale an embedding to unit length so cosine distance is a plain dot product.
+    :param vector: The raw embedding.
+    :return: The L2-normalized embedding as float32.
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def decode_image(image: str | bytes | bytearray | np.ndarray) -> np.ndarray:
+    """
+    Decode an image once into a BGR array. Decoding is also the validation: data that
+    does not decode is rejected here, before anything else touches it.
+    :param image: Path to an image file, the encoded image bytes (e.g. an HTTP upload),
+                  or an already decoded BGR array, returned as is.
+    :return: The decoded image.
+    :raises FileNotFoundError: If the path does not exist.
+    :raises ValueError: If the image cannot be decoded.
+    """
+    if isinstance(image, np.ndarray):
+        if image.ndim != 3 or image.shape[2] != 3:
+            raise ValueError("Image array must have shape (height, width, 3).")
+        return image
+    if isinstance(image, (bytes, bytearray)):
+        decoded = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if decoded is None:
+            raise ValueError("Invalid image data. Unable to decode the image.")
+        return decoded
+    if isinstance(image, str):
+        if not os.path.exists(image):
+            raise FileNotFoundError(f"Image file not found: {image}")
+        decoded = cv2.imread(image)
+        if decoded is None:
+            raise ValueError(f"Invalid image file: {image}")
+        return decoded
+    raise ValueError("Image must be a path, encoded bytes or a decoded array.")
+
+
+def detect_face(image: np.ndarray) -> tuple[np.ndarray, dict]:
+    """
+    Detect and align the main (largest) face of a decoded image.
+    Without a detected face the whole image is returned, like `enforce_detection=False` does.
+    :param image: The decoded BGR image.
+    :return: A tuple (aligned RGB face, facial area in the image).
+    """
+    faces = _deepface().extract_faces(img_path=image, detector_backend=DETECTOR_BACKEND,
+                                      enforce_detection=False, align=True)
+    main_face = max(faces, key=lambda face: face["facial_area"]["w"] * face["facial_area"]["h"])
+    return main_face["face"], main_face["facial_area"]
+
+
+def probe_face(image: np.ndarray | FaceCrop) -> np.ndarray:
+    """
+    The aligned RGB face to embed for a probe: a pre-detected crop is used as is,
+    a decoded image goes through `detect_face`.
+    :param image: The decoded BGR image or a `FaceCrop`.
+    """
+    if isinstance(image, FaceCrop):
+        return image.face()
+    return detect_face(image)[0]
+
+
+def embed_faces(faces: list[np.ndarray]) -> np.ndarray:
+    """
+    Embed already detected and aligned faces in one batched forward pass of the model.
+    Preprocessing matches DeepFace.represent: RGB to BGR, then resize to the model input.
+    The forward pass waits for a slot of the process-wide inference scheduler.
+    :param faces: Aligned RGB faces, as returned by `detect_face`.
+    :return: The L2-normalized embeddings, shape (faces, dimension).
+    """
+    from deepface.modules import preprocessing
+
+    forward, input_size = _model()
+    batch = np.vstack([
+        preprocessing.resize_image(img=face[:, :, ::-1], target_size=input_size)
+        for face in faces
+    ]).astype(np.float32)
+    with get_scheduler().slot():
+        embeddings = forward(batch).numpy()
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.where(norms > 0, norms, 1.0)
+
+
+def embed_face(face: np.ndarray) -> np.ndarray:
+    """
+    Embed an already detected and aligned face, skipping detection.
+    :param face: The aligned RGB face, as returned by `detect_face`.
+    :return: The L2-normalized embedding.
+    """
+    return embed_faces([face])[0]
+
+
+def represent(image: str | bytes | bytearray | np.ndarray | FaceCrop) -> np.ndarray:
+    """
+    Compute the embedding of the face found in an image.
+    The image is decoded, detected, aligned and embedded exactly once, callers reuse the
+    returned vector for every comparison. A `FaceCrop` skips decoding and detection.
+    :param image: Path to the face image, its encoded bytes, the decoded BGR image or a pre-detected face crop.
+    :return: The L2-normalized embedding.
+    """
+    if not isinstance(image, FaceCrop):
+        image = decode_image(image)
+    return embed_face(probe_face(image))
+
+
+def represent_many(images: list[np.ndarray | FaceCrop]) -> np.ndarray:
+    """
+    Compute the embeddings of several faces (e.g. every face of a frame) in one batched forward pass.
+    :param images: Decoded BGR images or pre-detected face crops.
+    :return: The L2-normalized embeddings, shape (images, dimension).
+    """
+    return embed_faces([probe_face(image) for image in images])
+
+
+def cosine_distance(first: np.ndarray, second: np.ndarray) -> float:
+    """
+    Cosine distance between two normalized embeddings.
+    """
+    return float(1.0 - np.dot(first, second))
+
+
+def to_blob(vector: np.ndarray) -> bytes:
+    """
+    Serialize an embedding for storage in the database.
+    """
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def from_blob(blob: bytes) -> np.ndarray:
+    """
+    Deserialize an embedding stored with `to_blob`.
+    """
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+def warm_up() -> None:
+    """
+    Load the model and trace its forward pass, so the first real probe does not pay for it.
+    """
+    embed_faces([np.zeros((*_model()[1], 3), dtype=np.float32)])
+    _ready.set()
+
+
+def start_warm_up() -> threading.Thread:
+    """
+    Warm the model up on a background thread (idempotent).
+    """
+    global _warm_up_thread
+
+    def run():
+        try:
+            warm_up()
+            logging.info(f"{MODEL_NAME} model loaded and ready.")
+        except Exception as e:
+            logging.error(f"Error warming up the {MODEL_NAME} model: {e}")
+
+    with _warm_up_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=run, daemon=True)
+            _warm_up_thread.start()
+        return _warm_up_thread
+
+
+def is_ready() -> bool:
+    """Whether the model is loaded and its forward pass traced."""
+    return _ready.is_set()
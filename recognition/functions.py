@@ -1,87 +1,76 @@
 import os
 from datetime import datetime
 from typing import Dict, Union
-from deepface import DeepFace
+import numpy as np
 from recognition.save import save_face_image
+from recognition.embedding import DISTANCE_THRESHOLD, represent, decode_image
+from recognition.store import delete_embeddings
+from recognition.gallery import get_gallery
 
 BASE_IMAGE_DIR = "./faces/"
 
 
-def validate_inputs(operator_id: str, image_path: str) -> None:
+def validate_inputs(operator_id: str, image: Union[str, bytes, np.ndarray]) -> np.ndarray:
     """
-    Validate the operator ID and image path.
+    Validate the operator ID and decode the image.
     :param operator_id: The operator's unique identifier.
-    :param image_path: Path to the new profile image.
+    :param image: Path to the new profile image, its encoded bytes or the decoded BGR array.
+    :return: The decoded image.
     :raises ValueError: If the inputs are invalid.
     """
     if not operator_id or not isinstance(operator_id, str):
         raise ValueError("Operator ID must be a non-empty string.")
-    if not image_path or not os.path.isfile(image_path):
+    if image is None or (isinstance(image, str) and not os.path.isfile(image)):
         raise ValueError("Invalid image path provided.")
+    return decode_image(image)
 
 
-def verify_existing_profiles(operator_folder: str, image_path: str) -> bool:
+def verify_existing_profiles(operator_id: str, probe: np.ndarray) -> bool:
     """
     Verify if the new image matches any existing profiles of the operator.
-    :param operator_folder: Path to the operator's folder.
-    :param image_path: Path to the new profile image.
+    :param operator_id: The operator's unique identifier.
+    :param probe: Embedding of the new profile image, computed once by the caller.
     :return: True if a match is found, otherwise False.
     """
-    for stored_image_name in os.listdir(operator_folder):
-        stored_image_path = os.path.join(operator_folder, stored_image_name)
-        try:
-            result = DeepFace.verify(
-                img1_path=image_path,
-                img2_path=stored_image_path,
-                model_name="VGG-Face",
-                enforce_detection=False
-            )
-            if result.get("verified"):
-                return True
-        except Exception as e:
-            print(f"Error during face verification with {stored_image_path}: {e}")
-    return False
-
-
-def upload_profile(operator_id: str, image_path: str) -> Dict[str, Union[str, Dict]]:
+    _, matrix = get_gallery().operator_embeddings(operator_id)
+    if len(matrix) == 0:
+        return False
+    return bool(np.any(1.0 - matrix @ probe <= DISTANCE_THRESHOLD))
+
+
+def upload_profile(operator_id: str, image: Union[str, bytes, np.ndarray]) -> Dict[str, Union[str, Dict]]:
     """
     Verify if a face already exists for the operator. If not, save it.
+    The image is decoded once and the same array is embedded and saved, nothing goes through a temporary file.
 
     Args:
         operator_id (str): The ID of the operator.
-        image_path (str): Path to the new profile image.
+        image (str | bytes | np.ndarray): Path to the new profile image, its encoded bytes or the decoded BGR array.
 
     Returns:
         dict: Result of the operation with status and message.
     """
     try:
-        # Validate inputs
-        validate_inputs(operator_id, image_path)
+        # Validate inputs and decode the image
+        decoded = validate_inputs(operator_id, image)
 
-        # Define operator's folder and ensure it exists
-        operator_folder = os.path.join(BASE_IMAGE_DIR, f"operator_{operator_id}")
-        os.makedirs(operator_folder, exist_ok=True)
+        # Embed the new image once, the vector serves both the comparison and the stored profile
+        embedding = represent(decoded)
 
         # Compare the new image with existing profiles of the operator
-        if verify_existing_profiles(operator_folder, image_path):
+        if verify_existing_profiles(operator_id, embedding):
             return {
                 "status": "error",
                 "message": "Face already exists for this operator."
             }
 
-        # Read the image as binary data
-        try:
-            with open(image_path, "rb") as image_file:
-                image_data = image_file.read()
-        except Exception as e:
-            raise ValueError(f"Failed to read image from path {image_path}: {e}")
-
-        # Save the image and return success
-        profile_path = save_face_image(operator_id, image_data)
+        # Save the image, its embedding is stored with it so recognition never re-embeds it
+        profile_path = save_face_image(operator_id, decoded)
         return {
             "status": "success",
             "message": "Profile uploaded successfully.",
-            "profile_path": profile_path
+            "profile_path": profile_path,
+            "embedding": embedding
         }
 
     except ValueError as ve:
@@ -105,6 +94,7 @@ def delete_profile(profile_path: str) -> Dict[str, str]:
 
     try:
         os.remove(profile_path)
+        delete_embeddings(os.path.relpath(profile_path, BASE_IMAGE_DIR))
         return {"status": "success", "message": "Profile image deleted successfully."}
     except Exception as e:
         return {"status": "error", "message": f"Failed to delete profile image. Error: {e}"}
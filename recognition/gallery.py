@@ -0,0 +1,248 @@
+import os
+import threading
+
+import numpy as np
+
+from recognition.ann import get_index
+from recognition.embedding import DISTANCE_THRESHOLD
+from recognition.store import load_embeddings, load_embedding_metadata, gallery_file
+
+BASE_IMAGE_DIR = "./faces/"
+
+
+class Gallery:
+    """
+    All enrolled embeddings kept in one contiguous float32 matrix (one row per stored image),
+    so a probe is scored against the whole gallery with a single matrix-vector product.
+    When an ANN index is attached, only the rows it proposes are ranked instead.
+    Rows without an operator (deleted embeddings still in the append-only file) never match.
+    """
+
+    def __init__(self, keys: list[int], operator_ids: list[str], profile_paths: list[str], matrix: np.ndarray,
+                 state=None):
+        """
+        :param keys: The face_embeddings id of each row.
+        :param operator_ids: The operator of each row.
+        :param profile_paths: The stored image of each row, relative to the faces directory.
+        :param matrix: The normalized embeddings, shape (rows, dimension), possibly memory-mapped.
+        :param state: Generation of the shared gallery file this gallery was built from.
+        """
+        self.keys = list(keys)
+        self.rows_by_key = {key: row for row, key in enumerate(self.keys)}
+        self.operator_ids = list(operator_ids)
+        self.profile_paths = list(profile_paths)
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self.state = state
+        self.index = None
+        self.dead_rows = np.array([row for row, operator_id in enumerate(self.operator_ids) if operator_id is None],
+                                  dtype=np.int64)
+
+        # Manifest: the rows (stored images and embeddings) of each operator
+        self.operator_rows = {}
+        for row, operator_id in enumerate(self.operator_ids):
+            if operator_id is not None:
+                self.operator_rows.setdefault(operator_id, []).append(row)
+
+    @classmethod
+    def from_records(cls, records: list[tuple[int, str, str, np.ndarray]], state=None) -> "Gallery":
+        """
+        Build a gallery from (key, operator_id, profile_path, vector) tuples.
+        """
+        if not records:
+            return cls([], [], [], np.empty((0, 0), dtype=np.float32), state)
+        keys, operator_ids, profile_paths, vectors = zip(*records)
+        return cls(keys, operator_ids, profile_paths, np.vstack(vectors), state)
+
+    def __len__(self):
+        return len(self.operator_ids)
+
+    def operator_embeddings(self, operator_id: str) -> tuple[list[str], np.ndarray]:
+        """
+        The stored images of one operator and their embeddings.
+        :return: A tuple (profile paths, embeddings of shape (images, dimension)).
+        """
+        rows = self.operator_rows.get(operator_id, [])
+        if not rows:
+            return [], np.empty((0, self.matrix.shape[1] if self.matrix.ndim == 2 else 0), dtype=np.float32)
+        return [self.profile_paths[row] for row in rows], self.matrix[rows]
+
+    def scores(self, probe: np.ndarray) -> np.ndarray:
+        """
+        Cosine similarity of a normalized probe with every row of the gallery.
+        """
+        similarities = self.matrix @ np.asarray(probe, dtype=np.float32)
+        similarities[self.dead_rows] = -np.inf
+        return similarities
+
+    def scores_many(self, probes: np.ndarray) -> np.ndarray:
+        """
+        Cosine similarities of several normalized probes with every row of the gallery, in one matrix product.
+        :return: An array of shape (probes, rows).
+        """
+        similarities = np.asarray(probes, dtype=np.float32) @ self.matrix.T
+        similarities[:, self.dead_rows] = -np.inf
+        return similarities
+
+    def search(self, probe: np.ndarray, k: int = 5, threshold: float = DISTANCE_THRESHOLD) -> dict:
+        """
+        Find the k operators closest to a probe embedding.
+        Each operator is ranked by its closest stored image; ties go to the earliest enrolled row,
+        so the result does not depend on anything but the gallery content.
+
+        :param probe: The normalized probe embedding.
+        :param k: Number of operators to return.
+        :param threshold: Cosine distance under which a candidate is a verified match.
+        :return: A dict with the threshold used and the ranked matches with their distances.
+        """
+        if len(self) == 0 or k <= 0:
+            return self._result([], [], threshold)
+        return self._result(*self._top_rows(probe, k), threshold)
+
+    def search_many(self, probes: np.ndarray, k: int = 5, threshold: float = DISTANCE_THRESHOLD) -> list[dict]:
+        """
+        Find the k operators closest to each of several probe embeddings, e.g. every face of a frame.
+        Without an ANN index, all the probes are scored against the gallery in one matrix product.
+
+        :param probes: The normalized probe embeddings, shape (probes, dimension).
+        :param k: Number of operators to return per probe.
+        :param threshold: Cosine distance under which a candidate is a verified match.
+        :return: One result per probe, as returned by `search`.
+        """
+        if len(self) == 0 or k <= 0:
+            return [self._result([], [], threshold) for _ in probes]
+        if self.index is not None:
+            return [self.search(probe, k=k, threshold=threshold) for probe in probes]
+        similarities = self.scores_many(probes)
+        return [self._result(*self._top_rows(probe, k, row_similarities), threshold)
+                for probe, row_similarities in zip(probes, similarities)]
+
+    def _result(self, rows: list[int], similarities: list[float], threshold: float) -> dict:
+        """
+        Build the search result of ranked rows.
+        """
+        result = {"metric": "cosine", "threshold": threshold, "matches": []}
+        for row, similarity in zip(rows, similarities):
+            cosine = 1.0 - similarity
+            result["matches"].append({
+                "operator_id": self.operator_ids[row],
+                "image_path": os.path.join(BASE_IMAGE_DIR, self.profile_paths[row]),
+                "distance": cosine,
+                "l2_distance": float(np.sqrt(max(0.0, 2.0 - 2.0 * similarity))),
+                "verified": cosine <= threshold
+            })
+        return result
+
+    def _candidates(self, probe: np.ndarray, window: int, similarities: np.ndarray | None):
+        """
+        The `window` best rows for a probe with their similarities, best first,
+        lowest row index on ties. Uses the ANN index when one is attached.
+        """
+        if self.index is not None:
+            keys, scores = self.index.search(probe, window)
+            # The shared index may already hold rows a newer gallery added: skip the ones not in this one
+            rows = np.array([self.rows_by_key.get(key, -1) for key in keys.tolist()], dtype=np.int64)
+            known = rows >= 0
+            rows, scores = rows[known], scores[known]
+        else:
+            total = len(similarities)
+            rows = np.argpartition(-similarities, window - 1)[:window] if window < total else np.arange(total)
+            scores = similarities[rows]
+        order = np.lexsort((rows, -scores))
+        return rows[order], scores[order]
+
+    def _top_rows(self, probe: np.ndarray, k: int,
+                  similarities: np.ndarray | None = None) -> tuple[list[int], list[float]]:
+        """
+        Rows and similarities of the k best distinct operators, best first.
+        Ranks a growing candidate window until it holds k distinct operators.
+        :param similarities: The similarities of the probe with every row, when already computed.
+        """
+        if similarities is None and self.index is None:
+            similarities = self.scores(probe)
+        total = len(self)
+        window = min(total, k)
+        while True:
+            candidates, scores = self._candidates(probe, window, similarities)
+
+            rows, best, seen = [], [], set()
+            for row, score in zip(candidates.tolist(), scores.tolist()):
+                operator_id = self.operator_ids[row]
+                if operator_id is None or operator_id in seen:
+                    continue
+                seen.add(operator_id)
+                rows.append(row)
+                best.append(score)
+                if len(rows) == k:
+                    return rows, best
+            # Stop once the window covers everything that can be ranked
+            if window >= total or len(candidates) < window:
+                return rows, best
+            window = min(total, window * 2)
+
+
+_gallery = None
+_gallery_lock = threading.Lock()
+
+
+def load_gallery() -> Gallery:
+    """
+    Map the shared gallery file, first appending any stored embedding it is missing
+    (e.g. the file was deleted, or an enrollment did not reach it).
+    """
+    metadata = load_embedding_metadata()
+    shared = gallery_file()
+
+    keys, matrix, generation = shared.load()
+    missing = set(metadata) - set(keys.tolist())
+    if missing:
+        records = load_embeddings(ids=missing)
+        shared.append([record[0] for record in records], np.vstack([record[3] for record in records]))
+        keys, matrix, generation = shared.load()
+
+    rows = [metadata.get(key, (None, None)) for key in keys.tolist()]
+    operator_ids = [operator_id for operator_id, _ in rows]
+    profile_paths = [profile_path for _, profile_path in rows]
+    return Gallery(keys.tolist(), operator_ids, profile_paths, matrix, generation)
+
+
+def extend_gallery(gallery: Gallery) -> Gallery:
+    """
+    Map the rows appended to the shared file since the gallery was built,
+    only fetching the owners of the new rows from the database.
+    """
+    keys, matrix, generation = gallery_file().load()
+    if generation is None or generation[1:] != gallery.state[1:]:
+        return load_gallery()  # Something was deleted, or the file recreated, in the meantime
+    new_keys = keys[len(gallery):].tolist()
+    metadata = load_embedding_metadata(ids=new_keys)
+
+    rows = [metadata.get(key, (None, None)) for key in new_keys]
+    operator_ids = gallery.operator_ids + [operator_id for operator_id, _ in rows]
+    profile_paths = gallery.profile_paths + [profile_path for _, profile_path in rows]
+    return Gallery(keys.tolist(), operator_ids, profile_paths, matrix, generation)
+
+
+def get_gallery() -> Gallery:
+    """
+    Return the process-wide gallery, refreshed when the shared file's generation changed.
+    Appends by other processes are picked up incrementally, deletions and a recreated file
+    (a new nonce, its counters starting over) trigger a full reload.
+    """
+    global _gallery
+
+    generation = gallery_file().generation()
+    with _gallery_lock:
+        if _gallery is not None and generation is not None and _gallery.state == generation:
+            return _gallery
+
+        previous = _gallery
+        if previous is not None and generation is not None and previous.state is not None \
+                and generation[1:] == previous.state[1:] and generation[0] > previous.state[0]:
+            _gallery = extend_gallery(previous)
+        else:
+            _gallery = load_gallery()
+
+        live_keys = [key if operator_id is not None else -1
+                     for key, operator_id in zip(_gallery.keys, _gallery.operator_ids)]
+        _gallery.index = get_index(live_keys, _gallery.matrix)
+        return _gallery
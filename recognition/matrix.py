@@ -0,0 +1,185 @@
+import os
+import struct
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+# Embedding rows (raw float32, after a fixed header) and the face_embeddings id of each row (raw int64)
+GALLERY_PATH = "./faces/gallery.f32"
+GALLERY_KEYS_PATH = "./faces/gallery.keys"
+GALLERY_LOCK_PATH = "./faces/gallery.lock"
+
+_MAGIC = b"FRSE"
+_FORMAT_VERSION = 2
+# magic, format version, dimension, deletion counter, committed row count, file nonce, model tag
+_HEADER = struct.Struct("<4sIIIQQ32s")
+HEADER_SIZE = _HEADER.size  # 64 bytes, keeps the rows float32 aligned
+_DELETIONS_OFFSET = 12
+_COUNT_OFFSET = 16
+
+_thread_lock = threading.Lock()
+
+
+@contextmanager
+def _file_lock(path: str = GALLERY_LOCK_PATH):
+    """
+    Exclusive lock shared by every process using the gallery file (GUI, API workers).
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with _thread_lock, open(path, "a+b") as lock_file:
+        if os.name == "nt":
+            import msvcrt
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class EmbeddingMatrixFile:
+    """
+    Append-only file of embeddings, memory-mapped read-only by every process.
+    All processes map the same pages from the OS page cache, so resident memory stays flat
+    as API workers are added. Appends write the rows first and only then bump the committed
+    row count in the header, so readers never map a partially written row.
+
+    The (row count, deletion counter, file nonce) triple in the header is the gallery generation:
+    every enrollment or deletion in any process changes it, and so does recreating the file (which
+    resets the counters), so a process knows whether its cached gallery is current by reading
+    64 bytes, without listing directories or querying the database.
+    """
+
+    def __init__(self, path: str = GALLERY_PATH, keys_path: str = GALLERY_KEYS_PATH, model_tag: str = ""):
+        """
+        :param path: Path of the embedding rows file.
+        :param keys_path: Path of the row keys file.
+        :param model_tag: Model name and version, a file written by another model is rebuilt.
+        """
+        self.path = path
+        self.keys_path = keys_path
+        self.model_tag = model_tag.encode("ascii", "replace")[:32]
+
+    def _read_header(self) -> tuple[int, int, int, int] | None:
+        """
+        :return: A tuple (dimension, committed rows, deletions, file nonce), or None if the file is missing or stale.
+        """
+        try:
+            with open(self.path, "rb") as matrix_file:
+                raw = matrix_file.read(HEADER_SIZE)
+        except FileNotFoundError:
+            return None
+        if len(raw) < HEADER_SIZE:
+            return None
+        magic, version, dimension, deletions, count, nonce, tag = _HEADER.unpack(raw)
+        if magic != _MAGIC or version != _FORMAT_VERSION or tag.rstrip(b"\0") != self.model_tag:
+            return None
+        return dimension, count, deletions, nonce
+
+    def exists(self) -> bool:
+        """Whether a file written by the current model exists."""
+        return self._read_header() is not None
+
+    def generation(self) -> tuple[int, int, int] | None:
+        """
+        :return: A tuple (committed rows, deletions, file nonce) that changes on every append or deletion
+                 and when the file is recreated, or None if there is no file for the current model.
+        """
+        header = self._read_header()
+        return None if header is None else header[1:]
+
+    def mark_deleted(self) -> None:
+        """
+        Bump the deletion counter after embeddings were deleted from the database,
+        so every process reloads which rows are still live.
+        """
+        with _file_lock():
+            header = self._read_header()
+            if header is None:
+                return
+            with open(self.path, "r+b") as matrix_file:
+                matrix_file.seek(_DELETIONS_OFFSET)
+                matrix_file.write(struct.pack("<I", (header[2] + 1) & 0xFFFFFFFF))
+                matrix_file.flush()
+                os.fsync(matrix_file.fileno())
+
+    def _create(self, dimension: int) -> int:
+        """
+        Start an empty file, replacing any stale one atomically.
+        A new nonce tells the other processes it is a different file, even once its counters
+        are back to the values of the one they cached.
+        :return: The nonce of the new file.
+        """
+        nonce = int.from_bytes(os.urandom(8), "little")
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as matrix_file:
+            matrix_file.write(_HEADER.pack(_MAGIC, _FORMAT_VERSION, dimension, 0, 0, nonce, self.model_tag))
+        with open(f"{self.keys_path}.{os.getpid()}.tmp", "wb"):
+            pass
+        os.replace(f"{self.keys_path}.{os.getpid()}.tmp", self.keys_path)
+        os.replace(temp_path, self.path)
+        return nonce
+
+    def append(self, keys, vectors: np.ndarray) -> int:
+        """
+        Append embeddings, skipping keys already in the file.
+        :param keys: The face_embeddings ids of the vectors.
+        :param vectors: Normalized embeddings, shape (rows, dimension).
+        :return: The number of rows appended.
+        """
+        keys = np.atleast_1d(np.asarray(keys, dtype=np.int64))
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(keys), -1)
+        if len(keys) == 0:
+            return 0
+
+        with _file_lock():
+            header = self._read_header()
+            if header is None or header[0] != vectors.shape[1]:
+                header = (vectors.shape[1], 0, 0, self._create(vectors.shape[1]))
+            dimension, count, _, _ = header
+
+            new = ~np.isin(keys, np.fromfile(self.keys_path, dtype=np.int64, count=count))
+            keys, vectors = keys[new], vectors[new]
+            if len(keys) == 0:
+                return 0
+
+            # Rows past the committed count belong to an interrupted append and are overwritten
+            with open(self.path, "r+b") as matrix_file, open(self.keys_path, "r+b") as keys_file:
+                matrix_file.seek(HEADER_SIZE + count * dimension * 4)
+                matrix_file.write(np.ascontiguousarray(vectors).tobytes())
+                keys_file.seek(count * 8)
+                keys_file.write(keys.tobytes())
+                matrix_file.flush()
+                keys_file.flush()
+                os.fsync(matrix_file.fileno())
+                os.fsync(keys_file.fileno())
+
+                matrix_file.seek(_COUNT_OFFSET)
+                matrix_file.write(struct.pack("<Q", count + len(keys)))
+                matrix_file.flush()
+                os.fsync(matrix_file.fileno())
+        return len(keys)
+
+    def load(self) -> tuple[np.ndarray, np.ndarray, tuple[int, int, int] | None]:
+        """
+        Map the committed rows.
+        :return: A tuple (keys, read-only memory-mapped matrix of shape (rows, dimension), generation).
+        """
+        with _file_lock():
+            header = self._read_header()
+            if header is None or header[1] == 0:
+                generation = None if header is None else header[1:]
+                return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32), generation
+            dimension, count, deletions, nonce = header
+            keys = np.fromfile(self.keys_path, dtype=np.int64, count=count)
+            matrix = np.memmap(self.path, dtype=np.float32, mode="r", offset=HEADER_SIZE, shape=(count, dimension))
+        return keys, matrix, (count, deletions, nonce)
@@ -1,5 +1,6 @@
 import os
 import io
+import numpy as np
 from PIL import Image, UnidentifiedImageError
 from datetime import datetime
 from typing import Union, BinaryIO
@@ -29,25 +30,27 @@ def create_operator_directory(operator_id: str) -> str:
     return operator_dir
 
 
-def load_image(image: Union[Image.Image, bytes, bytearray, BinaryIO]) -> Image.Image:
+def load_image(image: Union[Image.Image, np.ndarray, bytes, bytearray, BinaryIO]) -> Image.Image:
     """
     Load the image into a PIL Image object.
-    :param image: The image to load. Can be a PIL Image, binary data, or file-like object.
+    :param image: The image to load. Can be a PIL Image, a decoded BGR array, binary data, or file-like object.
     :return: PIL Image object.
     :raises ValueError: If the image data is invalid.
     """
     if isinstance(image, Image.Image):
         return image
+    elif isinstance(image, np.ndarray):
+        return Image.fromarray(image[:, :, ::-1])  # BGR (OpenCV) to RGB
     elif isinstance(image, (bytes, bytearray, io.IOBase)):
         try:
-            # Verify and load the image
+            # Decode once: a full load fails on corrupt data, so no separate verify pass is needed
             pil_image = Image.open(io.BytesIO(image)) if isinstance(image, (bytes, bytearray)) else Image.open(image)
-            pil_image.verify()  # Verify the image integrity
-            return Image.open(io.BytesIO(image)) if isinstance(image, (bytes, bytearray)) else Image.open(image)  # Reload for use
-        except UnidentifiedImageError:
+            pil_image.load()
+            return pil_image
+        except (UnidentifiedImageError, OSError):
             raise ValueError("Invalid image data. Unable to open the image.")
     else:
-        raise ValueError("Image must be a PIL Image, binary data, or file-like object.")
+        raise ValueError("Image must be a PIL Image, an array, binary data, or file-like object.")
 
 
 def convert_to_rgb_if_needed(image: Image.Image, image_format: str) -> Image.Image:
@@ -64,7 +67,7 @@ def convert_to_rgb_if_needed(image: Image.Image, image_format: str) -> Image.Ima
 
 def save_face_image(
     operator_id: str,
-    image: Union[Image.Image, bytes, bytearray, BinaryIO],
+    image: Union[Image.Image, np.ndarray, bytes, bytearray, BinaryIO],
     image_format: str = "JPEG",
     quality: int = 95
 ) -> str:
@@ -72,7 +75,8 @@ def save_face_image(
     Save the given face image to the filesystem.
 
     :param operator_id: The operator's unique identifier.
-    :param image: The face image to be saved. Can be a PIL Image object, binary data, or file-like object.
+    :param image: The face image to be saved. Can be a PIL Image object, a decoded BGR array, binary data,
+                  or file-like object.
     :param image_format: The format to save the image (e.g., "JPEG", "PNG"). Default is "JPEG".
     :param quality: Quality of the saved image (1-100, applicable for lossy formats like JPEG). Default is 95.
     :return: The relative path to the saved image.
@@ -0,0 +1,152 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+
+def _env_int(name: str, default: int | None) -> int | None:
+    """
+    Read a positive integer setting from the environment, at startup.
+    :return: Its value, None for 0 (the TensorFlow default), or `default` when it is unset or invalid.
+    """
+    value = os.environ.get(name, "").strip()
+    if not value:
+        return default
+    try:
+        number = int(value)
+        if number < 0:
+            raise ValueError(value)
+    except ValueError:
+        logging.warning(f"Invalid {name}={value!r}, using {default}.")
+        print(f"Invalid {name}={value!r}, using {default}.")
+        return default
+    return number or None
+
+
+# Model calls allowed to run at the same time in one process, the others wait their turn
+# (environment variable FRS_MAX_IN_FLIGHT)
+MAX_IN_FLIGHT = _env_int("FRS_MAX_IN_FLIGHT", None) or 1
+
+# TensorFlow thread pools (None keeps the TensorFlow default), sized by default so that
+# MAX_IN_FLIGHT calls do not oversubscribe the cores
+# (environment variables FRS_TF_INTRA_OP_THREADS and FRS_TF_INTER_OP_THREADS, 0 for the TensorFlow default)
+TF_INTRA_OP_THREADS = _env_int("FRS_TF_INTRA_OP_THREADS", max(1, (os.cpu_count() or 1) // MAX_IN_FLIGHT))
+TF_INTER_OP_THREADS = _env_int("FRS_TF_INTER_OP_THREADS", 1)
+
+
+def configure_tensorflow(intra_op_threads: int | None = TF_INTRA_OP_THREADS,
+                         inter_op_threads: int | None = TF_INTER_OP_THREADS) -> bool:
+    """
+    Size the TensorFlow thread pools. Only effective before TensorFlow runs its first operation.
+    :return: True if the settings were applied.
+    """
+    import tensorflow as tf
+
+    try:
+        if intra_op_threads:
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        if inter_op_threads:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+        return True
+    except RuntimeError as e:
+        logging.warning(f"TensorFlow threads already initialized, settings ignored: {e}")
+        return False
+
+
+class InferenceScheduler:
+    """
+    Bounds the number of model calls running at once in the process and measures
+    how long callers queue for a slot.
+    """
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT):
+        """
+        :param max_in_flight: Maximum number of concurrent model calls.
+        """
+        self.max_in_flight = max_in_flight
+        self.slots = threading.Semaphore(max_in_flight)
+        self.lock = threading.Lock()
+        self.waiting = 0
+        self.in_flight = 0
+        self.calls = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+    @contextmanager
+    def slot(self):
+        """
+        Hold one model-call slot for the duration of the block.
+        """
+        start = time.perf_counter()
+        with self.lock:
+            self.waiting += 1
+        self.slots.acquire()
+        waited = time.perf_counter() - start
+        with self.lock:
+            self.waiting -= 1
+            self.in_flight += 1
+            self.calls += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            self.last_wait = waited
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+            self.slots.release()
+
+    def stats(self) -> dict:
+        """
+        :return: Queue depth, calls in flight and wait times in milliseconds.
+        """
+        with self.lock:
+            return {
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self.in_flight,
+                "queue_depth": self.waiting,
+                "calls": self.calls,
+                "average_wait_ms": self.total_wait / self.calls * 1000 if self.calls else 0.0,
+                "max_wait_ms": self.max_wait * 1000,
+                "last_wait_ms": self.last_wait * 1000,
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> InferenceScheduler:
+    """
+    The process-wide scheduler, created (and TensorFlow configured) on first use.
+    """
+    global _scheduler
+
+    with _scheduler_lock:
+        if _scheduler is None:
+            configure_tensorflow()
+            _scheduler = InferenceScheduler()
+        return _scheduler
+
+
+def scheduler_stats() -> dict | None:
+    """
+    Stats of the process-wide scheduler, or None if no model call happened yet.
+    """
+    return _scheduler.stats() if _scheduler is not None else None
+
+
+def configure(max_in_flight: int = MAX_IN_FLIGHT, intra_op_threads: int | None = TF_INTRA_OP_THREADS,
+              inter_op_threads: int | None = TF_INTER_OP_THREADS) -> InferenceScheduler:
+    """
+    Replace the process-wide scheduler, e.g. in an inference worker sharing the cores with others.
+    Call it before the first model call, TensorFlow thread pools cannot be resized afterwards.
+    """
+    global _scheduler
+
+    with _scheduler_lock:
+        configure_tensorflow(intra_op_threads, inter_op_threads)
+        _scheduler = InferenceScheduler(max_in_flight)
+        return _scheduler
@@ -0,0 +1,311 @@
+import os
+import time
+import queue
+import logging
+import threading
+import itertools
+import multiprocessing
+from concurrent.futures import Future
+
+import numpy as np
+
+from recognition.crop import FaceCrop
+from recognition.embedding import represent, represent_many
+from recognition.scheduler import TF_INTRA_OP_THREADS
+
+# Worker processes started by `start_service`
+INFERENCE_WORKERS = 2
+
+# A batch is closed when it holds this many probes...
+MAX_BATCH_SIZE = 16
+
+# ...or this long after its first probe arrived
+BATCH_WINDOW_MS = 5
+
+# How long a caller waits for its embedding
+EMBED_TIMEOUT = 30.0
+
+# How often, in seconds, the collector checks that the workers are still alive while no result comes in
+LIVENESS_INTERVAL = 1.0
+
+
+def _worker_main(requests, results, max_batch_size: int, batch_window: float, intra_op_threads: int) -> None:
+    """
+    Worker process: load the model once, then embed probes in micro-batches.
+    Probes arriving within `batch_window` seconds of the first one share one forward pass.
+    A worker that cannot load the model reports it on `results` and exits, instead of leaving
+    the parent waiting for a "ready" that never comes.
+    """
+    try:
+        from recognition.scheduler import configure
+        from recognition.embedding import probe_face, embed_faces, warm_up
+
+        # The workers split the cores between them instead of each sizing TensorFlow for the whole machine
+        configure(max_in_flight=1, intra_op_threads=intra_op_threads)
+        warm_up()
+    except Exception as e:
+        results.put(("error", os.getpid(), f"{type(e).__name__}: {e}"))
+        return
+    results.put(("ready", os.getpid(), None))
+    parent = multiprocessing.parent_process()
+
+    while True:
+        try:
+            request = requests.get(timeout=1.0)
+        except queue.Empty:
+            # The parent can be terminated without stopping us (e.g. the GUI stopping the API)
+            if parent is not None and not parent.is_alive():
+                break
+            continue
+        if request is None:
+            requests.put(None)  # Let the other workers see the stop signal too
+            break
+        batch = [request]
+        deadline = time.monotonic() + batch_window
+        while len(batch) < max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                requests.put(None)  # Let the other workers see the stop signal too
+                break
+            batch.append(request)
+
+        faces, request_ids = [], []
+        for request_id, image in batch:
+            try:
+                faces.append(probe_face(image))
+                request_ids.append(request_id)
+            except Exception as e:
+                results.put((request_id, None, str(e)))
+
+        if not faces:
+            continue
+        try:
+            embeddings = embed_faces(faces)
+            for request_id, embedding in zip(request_ids, embeddings):
+                results.put((request_id, embedding, None))
+        except Exception as e:
+            for request_id in request_ids:
+                results.put((request_id, None, str(e)))
+
+
+class InferenceService:
+    """
+    Pool of long-lived worker processes that hold the model in memory and embed probe
+    images in micro-batches, so concurrent check-ins share forward passes instead of each
+    running the model on its own.
+    While no worker is ready (still loading, failed to start or died), probes are embedded
+    in the calling process instead.
+    """
+
+    def __init__(self, workers: int = INFERENCE_WORKERS, max_batch_size: int = MAX_BATCH_SIZE,
+                 batch_window_ms: float = BATCH_WINDOW_MS):
+        """
+        :param workers: Number of worker processes.
+        :param max_batch_size: Maximum number of probes per forward pass.
+        :param batch_window_ms: How long a worker waits for more probes after the first one.
+        """
+        self.workers = workers
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window_ms / 1000
+        # Spawned workers do not inherit a half-initialized TensorFlow runtime from the parent
+        self.context = multiprocessing.get_context("spawn")
+        self.requests = self.context.Queue()
+        self.results = self.context.Queue()
+        self.processes = []
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        self.ids = itertools.count()
+        self.ready_pids = set()
+        self.failed_workers = 0
+        self.collector = None
+        self.running = False
+        self.submitted = 0
+        self.completed = 0
+        self.total_latency = 0.0
+
+    def start(self) -> None:
+        """Start the worker processes and the thread collecting their results."""
+        if self.running:
+            return
+        self.running = True
+        # The workers split the configured thread pool (all the cores by default) between them
+        intra_op_threads = max(1, (TF_INTRA_OP_THREADS or os.cpu_count() or 1) // max(1, self.workers))
+        for _ in range(self.workers):
+            process = self.context.Process(
+                target=_worker_main,
+                args=(self.requests, self.results, self.max_batch_size, self.batch_window, intra_op_threads),
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+        self.collector = threading.Thread(target=self._collect_results, daemon=True)
+        self.collector.start()
+
+    def stop(self) -> None:
+        """Stop the workers and fail the probes still waiting."""
+        if not self.running:
+            return
+        self.running = False
+        self.requests.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+        self.results.put(None)
+        self._fail_pending("Inference service stopped.")
+
+    @property
+    def alive_workers(self) -> int:
+        """Number of worker processes still running."""
+        return sum(1 for process in self.processes if process.is_alive())
+
+    @property
+    def ready_workers(self) -> int:
+        """Number of worker processes that loaded the model and are still running."""
+        return sum(1 for process in self.processes if process.pid in self.ready_pids and process.is_alive())
+
+    @property
+    def ready(self) -> bool:
+        """Whether at least one worker is running with the model loaded."""
+        return self.running and self.ready_workers > 0
+
+    def submit(self, image: np.ndarray | FaceCrop) -> Future:
+        """
+        Queue a decoded BGR probe image, or a pre-detected `FaceCrop`, for embedding.
+        :return: A future resolved with the L2-normalized embedding.
+        """
+        return self._submit(image)[1]
+
+    def _submit(self, image: np.ndarray | FaceCrop) -> tuple[int, Future]:
+        if not self.running:
+            raise RuntimeError("Inference service is not running.")
+        future = Future()
+        request_id = next(self.ids)
+        with self.pending_lock:
+            self.pending[request_id] = (future, time.perf_counter())
+            self.submitted += 1
+        self.requests.put((request_id, image))
+        return request_id, future
+
+    def _result(self, request_id: int, future: Future, timeout: float) -> np.ndarray:
+        """Wait for a submitted probe, forgetting it if it times out so the pending table does not grow."""
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            with self.pending_lock:
+                self.pending.pop(request_id, None)
+            raise
+
+    def embed(self, image: np.ndarray | FaceCrop, timeout: float = EMBED_TIMEOUT) -> np.ndarray:
+        """
+        Embed a decoded BGR probe image or a `FaceCrop`, blocking until its batch went through the model.
+        Embedded in-process when no worker is ready.
+        """
+        if not self.ready:
+            return represent(image)
+        return self._result(*self._submit(image), timeout)
+
+    def embed_many(self, images: list[np.ndarray | FaceCrop], timeout: float = EMBED_TIMEOUT) -> np.ndarray:
+        """
+        Embed several probes at once: they are queued together, so they share a batch.
+        Embedded in-process when no worker is ready.
+        :return: The L2-normalized embeddings, shape (images, dimension).
+        """
+        if not self.ready:
+            return represent_many(images)
+        submitted = [self._submit(image) for image in images]
+        return np.vstack([self._result(request_id, future, timeout) for request_id, future in submitted])
+
+    def stats(self) -> dict:
+        """
+        :return: Probes waiting for the workers and the average time to get an embedding back.
+        """
+        with self.pending_lock:
+            return {
+                "workers": self.workers,
+                "alive_workers": self.alive_workers,
+                "ready_workers": self.ready_workers,
+                "failed_workers": self.failed_workers,
+                "queue_depth": len(self.pending),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "average_latency_ms": self.total_latency / self.completed * 1000 if self.completed else 0.0,
+            }
+
+    def _fail_pending(self, reason: str) -> None:
+        """Fail every probe still waiting for a worker."""
+        with self.pending_lock:
+            for future, _ in self.pending.values():
+                future.set_exception(RuntimeError(reason))
+            self.pending.clear()
+
+    def _collect_results(self) -> None:
+        while True:
+            try:
+                message = self.results.get(timeout=LIVENESS_INTERVAL)
+            except queue.Empty:
+                # A worker killed (e.g. out of memory) sends nothing: its probes would wait for the timeout
+                if self.running and self.processes and not self.alive_workers:
+                    self._fail_pending("No inference worker is running.")
+                continue
+            if message is None:
+                break
+            request_id, embedding, error = message
+            # The startup messages carry the pid of the worker in place of an embedding
+            if request_id == "ready":
+                self.ready_pids.add(embedding)
+                continue
+            if request_id == "error":
+                self.failed_workers += 1
+                logging.error(f"Inference worker {embedding} failed to start: {error}")
+                print(f"Inference worker failed to start: {error}")
+                continue
+            with self.pending_lock:
+                future, submitted_at = self.pending.pop(request_id, (None, None))
+                if future is not None:
+                    self.completed += 1
+                    self.total_latency += time.perf_counter() - submitted_at
+            if future is None:
+                continue
+            if error is None:
+                future.set_result(embedding)
+            else:
+                future.set_exception(ValueError(error))
+
+
+_service = None
+
+
+def start_service(workers: int = INFERENCE_WORKERS) -> InferenceService:
+    """
+    Start the process-wide inference service (idempotent).
+    """
+    global _service
+
+    if _service is None:
+        _service = InferenceService(workers=workers)
+        _service.start()
+        logging.info(f"Inference service started with {workers} workers.")
+    return _service
+
+
+def get_service() -> InferenceService | None:
+    """
+    The running inference service, or None when probes are embedded in-process.
+    """
+    return _service if _service is not None and _service.running else None
+
+
+def stop_service() -> None:
+    global _service
+
+    if _service is not None:
+        _service.stop()
+        _service = None
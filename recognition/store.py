@@ -0,0 +1,157 @@
+import os
+import logging
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import and_
+
+from database import session, read_session, read_only
+from models import FaceEmbedding, Profile
+from recognition.matrix import EmbeddingMatrixFile
+from recognition.embedding import MODEL_NAME, MODEL_VERSION, represent, to_blob, from_blob
+
+BASE_IMAGE_DIR = "./faces/"
+
+
+def make_record(operator_id: str, profile_path: str, vector: np.ndarray) -> FaceEmbedding:
+    """
+    Build the database row holding the embedding of a profile image.
+    :param operator_id: The operator's unique identifier.
+    :param profile_path: Path of the image relative to the faces directory.
+    :param vector: The embedding computed for the image.
+    :return: An unsaved FaceEmbedding instance.
+    """
+    return FaceEmbedding(
+        operator_id=operator_id,
+        profile_path=profile_path,
+        model_name=MODEL_NAME,
+        model_version=MODEL_VERSION,
+        dimension=int(vector.shape[0]),
+        vector=to_blob(vector),
+        created_at=datetime.now()
+    )
+
+
+@read_only
+def load_embeddings(operator_id: str | None = None, ids=None) -> list[tuple[int, str, str, np.ndarray]]:
+    """
+    Load the stored embeddings computed by the current model.
+    :param operator_id: Only load the embeddings of this operator (all operators by default).
+    :param ids: Only load the embeddings with these ids.
+    :return: A list of (id, operator_id, profile_path, vector) tuples.
+    """
+    query = read_session.query(FaceEmbedding).filter_by(model_name=MODEL_NAME, model_version=MODEL_VERSION)
+    if operator_id is not None:
+        query = query.filter_by(operator_id=operator_id)
+    if ids is not None:
+        query = query.filter(FaceEmbedding.id.in_(list(ids)))
+    records = query.order_by(FaceEmbedding.id).all()
+    return [(record.id, record.operator_id, record.profile_path, from_blob(record.vector)) for record in records]
+
+
+@read_only
+def load_embedding_metadata(ids=None) -> dict[int, tuple[str, str]]:
+    """
+    Load who each stored embedding belongs to, without the vectors themselves.
+    :param ids: Only load these embeddings (all of them by default).
+    :return: A dict mapping the embedding id to (operator_id, profile_path).
+    """
+    rows = (
+        read_session.query(FaceEmbedding.id, FaceEmbedding.operator_id, FaceEmbedding.profile_path)
+        .filter_by(model_name=MODEL_NAME, model_version=MODEL_VERSION)
+    )
+    if ids is not None:
+        rows = rows.filter(FaceEmbedding.id.in_(list(ids)))
+    return {embedding_id: (operator_id, profile_path) for embedding_id, operator_id, profile_path in rows}
+
+
+def publish_embeddings(ids, vectors: np.ndarray) -> None:
+    """
+    Make newly stored embeddings visible to every process: append them to the shared
+    gallery file. The ANN index follows on the next gallery refresh (see `gallery.get_gallery`).
+    :param ids: The face_embeddings ids, once committed.
+    :param vectors: The embeddings, in the same order.
+    """
+    gallery_file().append(ids, vectors)
+
+
+def gallery_file() -> EmbeddingMatrixFile:
+    """
+    The shared gallery file of the current model.
+    """
+    return EmbeddingMatrixFile(model_tag=f"{MODEL_NAME}/{MODEL_VERSION}")
+
+
+def delete_embeddings(profile_path: str) -> list[int]:
+    """
+    Delete the stored embeddings of a profile image.
+    :param profile_path: Path of the image relative to the faces directory.
+    :return: The ids of the deleted embeddings.
+    """
+    records = session.query(FaceEmbedding).filter_by(profile_path=profile_path).all()
+    ids = [record.id for record in records]
+    for record in records:
+        session.delete(record)
+    session.commit()
+    gallery_file().mark_deleted()
+    return ids
+
+
+@read_only
+def operators_missing_embeddings() -> list[str]:
+    """
+    The operators with a profile but no embedding computed by the current model, e.g. enrolled
+    before embeddings were stored or before a model upgrade. One indexed query, no directory listing.
+    :return: Their ids.
+    """
+    rows = (
+        read_session.query(Profile.operator_id)
+        .outerjoin(FaceEmbedding, and_(FaceEmbedding.operator_id == Profile.operator_id,
+                                       FaceEmbedding.model_name == MODEL_NAME,
+                                       FaceEmbedding.model_version == MODEL_VERSION))
+        .filter(FaceEmbedding.id.is_(None))
+        .distinct()
+    )
+    return [operator_id for (operator_id,) in rows]
+
+
+def backfill_embeddings() -> int:
+    """
+    Compute the embeddings of stored face images that do not have one for the current model,
+    e.g. images enrolled before embeddings were persisted or after a model upgrade.
+    :return: The number of embeddings added.
+    """
+    if not os.path.isdir(BASE_IMAGE_DIR):
+        return 0
+
+    known = {
+        path for (path,) in read_session.query(FaceEmbedding.profile_path)
+        .filter_by(model_name=MODEL_NAME, model_version=MODEL_VERSION)
+    }
+    read_session.remove()
+
+    added = []
+    for operator_folder in os.listdir(BASE_IMAGE_DIR):
+        operator_dir = os.path.join(BASE_IMAGE_DIR, operator_folder)
+        if not operator_folder.startswith("operator_") or not os.path.isdir(operator_dir):
+            continue
+        operator_id = operator_folder.split("_", 1)[-1]
+
+        for image_name in os.listdir(operator_dir):
+            image_path = os.path.join(operator_dir, image_name)
+            profile_path = os.path.relpath(image_path, BASE_IMAGE_DIR)
+            if profile_path in known:
+                continue
+            try:
+                record = make_record(operator_id, profile_path, represent(image_path))
+                session.add(record)
+                added.append(record)
+            except Exception as e:
+                logging.error(f"Error computing the embedding of {image_path}: {e}")
+
+    if added:
+        session.commit()
+        vectors = np.vstack([from_blob(record.vector) for record in added])
+        publish_embeddings([record.id for record in added], vectors)
+        logging.info(f"Backfilled {len(added)} face embeddings.")
+    return len(added)
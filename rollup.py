@@ -0,0 +1,169 @@
+"""
+Daily attendance rollup: one `AttendanceDaily` row per operator and day, with the first arrival,
+the last departure, the time worked between them and anomaly flags.
+The attendance queue folds every batch of events into it in the same transaction (`apply_events`),
+and `backfill` rebuilds it from the raw events of a period.
+
+Run directly to rebuild a period (the whole history by default):
+
+    python rollup.py [start YYYY-MM-DD] [end YYYY-MM-DD]
+"""
+
+import sys
+import logging
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Integer, and_, case, cast, delete, func, literal, null, select, tuple_, union_all, update
+from sqlalchemy.dialects.sqlite import insert
+
+from models import Arrival, Departure, AttendanceDaily
+from database import session
+
+# Flags of an AttendanceDaily row
+# A departure without an arrival that day
+FLAG_NO_ARRIVAL = 1
+# An arrival without a departure that day (or not yet, for today)
+FLAG_NO_DEPARTURE = 2
+# The last departure is not after the first arrival
+FLAG_DEPARTED_BEFORE_ARRIVAL = 4
+
+# Days rebuilt per transaction by the backfill, so the writer is not held for the whole history
+BACKFILL_CHUNK_DAYS = 31
+
+# Rollup rows per statement, well under SQLite's limit of bound parameters
+ROWS_PER_STATEMENT = 200
+
+
+def _upsert(rows: list[tuple]) -> None:
+    """
+    Merge (operator_id, day, first_arrival, last_departure) rows into the rollup: the earliest
+    arrival and the latest departure win. Then refresh the columns derived from them.
+    """
+    table = AttendanceDaily
+    for position in range(0, len(rows), ROWS_PER_STATEMENT):
+        chunk = rows[position:position + ROWS_PER_STATEMENT]
+        statement = insert(table).values([
+            {"operator_id": operator_id, "day": day, "first_arrival": first_arrival,
+             "last_departure": last_departure, "worked_seconds": 0, "flags": 0}
+            for operator_id, day, first_arrival, last_departure in chunk
+        ])
+        excluded = statement.excluded
+        # SQLite's scalar min/max are NULL when an argument is: fall back on the one that is set
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.operator_id, table.day],
+            set_={
+                "first_arrival": func.coalesce(func.min(table.first_arrival, excluded.first_arrival),
+                                               table.first_arrival, excluded.first_arrival),
+                "last_departure": func.coalesce(func.max(table.last_departure, excluded.last_departure),
+                                                table.last_departure, excluded.last_departure),
+            },
+        )
+        session.execute(statement)
+        keys = [(operator_id, day) for operator_id, day, _, _ in chunk]
+        _refresh(tuple_(AttendanceDaily.operator_id, AttendanceDaily.day).in_(keys))
+
+
+def _refresh(where) -> None:
+    """Recompute worked_seconds and flags of the rows matching `where`."""
+    first, last = AttendanceDaily.first_arrival, AttendanceDaily.last_departure
+    worked = case(
+        (last > first, cast(func.round((func.julianday(last) - func.julianday(first)) * 86400), Integer)),
+        else_=0,
+    )
+    flags = (case((first.is_(None), FLAG_NO_ARRIVAL), else_=0)
+             + case((last.is_(None), FLAG_NO_DEPARTURE), else_=0)
+             + case((last <= first, FLAG_DEPARTED_BEFORE_ARRIVAL), else_=0))
+    session.execute(
+        update(AttendanceDaily)
+        .where(where)
+        .values(worked_seconds=worked, flags=flags)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def apply_events(events: list[tuple]) -> int:
+    """
+    Fold attendance events into the rollup, in the current transaction of `session`
+    (the caller commits, together with the events themselves).
+    :param events: (kind, operator_id, datestamp) tuples, kind being "arrival" or "departure".
+    :return: The number of rollup rows touched.
+    """
+    days = {}
+    for kind, operator_id, datestamp in events:
+        first_arrival, last_departure = days.get((operator_id, datestamp.date()), (None, None))
+        if kind == "arrival":
+            first_arrival = datestamp if first_arrival is None else min(first_arrival, datestamp)
+        else:
+            last_departure = datestamp if last_departure is None else max(last_departure, datestamp)
+        days[(operator_id, datestamp.date())] = (first_arrival, last_departure)
+    _upsert([(operator_id, day, first_arrival, last_departure)
+             for (operator_id, day), (first_arrival, last_departure) in days.items()])
+    return len(days)
+
+
+def _rebuild(start: date, end: date) -> int:
+    """Replace the rollup rows of [start, end] by the ones computed from the raw events."""
+    period_start = datetime.combine(start, datetime.min.time())
+    period_end = datetime.combine(end + timedelta(days=1), datetime.min.time())
+    session.execute(
+        delete(AttendanceDaily)
+        .where(AttendanceDaily.day >= start, AttendanceDaily.day <= end)
+        .execution_options(synchronize_session=False)
+    )
+    # Every event of the period as (operator_id, day, arrival, departure), then one row per operator and day
+    events = union_all(*(
+        select(model.operator_id, func.date(model.datestamp).label("day"),
+               (model.datestamp if model is Arrival else null()).label("arrival"),
+               (model.datestamp if model is Departure else null()).label("departure"))
+        .where(model.datestamp >= period_start, model.datestamp < period_end)
+        for model in (Arrival, Departure)
+    )).subquery()
+    days = select(events.c.operator_id, events.c.day, func.min(events.c.arrival), func.max(events.c.departure),
+                  literal(0), literal(0)).group_by(events.c.operator_id, events.c.day)
+    table = AttendanceDaily.__table__
+    # The period is empty now: filled in one statement, and the derived columns in another
+    written = session.execute(insert(table).from_select(
+        [table.c.operator_id, table.c.day, table.c.first_arrival, table.c.last_departure,
+         table.c.worked_seconds, table.c.flags], days
+    )).rowcount
+    _refresh(and_(AttendanceDaily.day >= start, AttendanceDaily.day <= end))
+    return written
+
+
+def backfill(start: date | None = None, end: date | None = None, chunk_days: int = BACKFILL_CHUNK_DAYS) -> int:
+    """
+    Rebuild the rollup of a period from the raw arrivals and departures, e.g. after they were
+    edited by hand. Each chunk of days is rebuilt in its own transaction.
+    :param start: First day, the day of the oldest event by default.
+    :param end: Last day, today by default.
+    :param chunk_days: Days rebuilt per transaction.
+    :return: The number of rollup rows written.
+    """
+    if start is None:
+        oldest = [session.query(func.min(model.datestamp)).scalar() for model in (Arrival, Departure)]
+        session.rollback()  # End the read transaction, the chunks start their own
+        oldest = [datestamp for datestamp in oldest if datestamp is not None]
+        if not oldest:
+            return 0
+        start = min(oldest).date()
+    end = end or date.today()
+
+    written = 0
+    while start <= end:
+        chunk_end = min(start + timedelta(days=chunk_days - 1), end)
+        try:
+            written += _rebuild(start, chunk_end)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        logging.info(f"Attendance rollup rebuilt from {start} to {chunk_end}.")
+        start = chunk_end + timedelta(days=1)
+    return written
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    first_day = date.fromisoformat(sys.argv[1]) if len(sys.argv) > 1 else None
+    last_day = date.fromisoformat(sys.argv[2]) if len(sys.argv) > 2 else None
+    print(f"{backfill(first_day, last_day)} daily attendance rows rebuilt.")
@@ -1,10 +1,12 @@
 import customtkinter as ctk
 from tkinter import ttk
-from datetime import datetime, date
-from sqlalchemy import not_
 
-from database import session
-from models import Arrival, Operator
+from database import read_session, read_only
+from models import Operator
+from presence import get_presence_index
+
+# Operator ids per query, well under SQLite's limit of bound parameters
+IDS_PER_QUERY = 500
 
 
 class Unarrived(ctk.CTkFrame):
@@ -60,15 +62,15 @@ class Unarrived(ctk.CTkFrame):
         self.unarrived_operators = []  # Store fetched data
         self.get_unarrived_operators()
 
+    @read_only
     def get_unarrived_operators(self):
         """Fetch and display operators who have not arrived today."""
-        today_start = datetime.combine(date.today(), datetime.min.time())
-
-        # Get all operator IDs that have arrived today
-        arrived_ids = {record.operator_id for record in session.query(Arrival).filter(Arrival.datestamp >= today_start)}
-
-        # Get operators who have NOT arrived today
-        self.unarrived_operators = session.query(Operator).filter(not_(Operator.id.in_(arrived_ids))).all()
+        # Who has not arrived today comes from the presence index, only those operators are read
+        operator_ids = get_presence_index().unarrived()
+        self.unarrived_operators = []
+        for position in range(0, len(operator_ids), IDS_PER_QUERY):
+            chunk = operator_ids[position:position + IDS_PER_QUERY]
+            self.unarrived_operators += read_session.query(Operator).filter(Operator.id.in_(chunk)).all()
 
         self.populate_table(self.unarrived_operators)
 